@@ -5,24 +5,26 @@ version = 'A5.1'
 # Created by suuuehgi (https://github.com/suuuehgi)
 # Modified by Aleksandar Ivanov (https://github.com/ackiivanov)
 
-import os, re, sys, subprocess, shutil
+import os, re, io, sys, subprocess, shutil, json, hashlib, codecs, textwrap
 
 import configparser
+import sqlite3
 
 from datetime import date
 import time
 
-import urllib.request as urllib
-from bs4 import BeautifulSoup
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from functools import cached_property
+from html.parser import HTMLParser
 
-import smtplib
-from email.mime.text import MIMEText
+from urllib.parse import urlsplit, urljoin, urlencode
 
-# Beatiful Soup throws a false warning when a website uses XHTML.
-# We ignore this warning
-import warnings
-from bs4 import XMLParsedAsHTMLWarning
-warnings.filterwarnings('ignore', category=XMLParsedAsHTMLWarning)
+# BeautifulSoup, urllib.request, http.client, smtplib and email take most of the startup
+# time, so they are only imported in the functions that use them. Flags like -v, -h and
+# runs with the streaming parser never load BeautifulSoup.
 
 
 # ================================== Settings ===================================
@@ -47,6 +49,112 @@ EMAIL_LOGIN = ''
 ATTRIBUTES = ['arxivid', 'url', 'categories', 'title', 'abstract', 'authors', 'comments']
 STYLE_STD = '($arxivid) $title - $authors.pdf'
 
+# Number of categories that are downloaded and parsed at the same time. Consecutive
+# requests to arxiv.org are spaced out by at least REQUEST_INTERVAL seconds to not put
+# too much load on the server. CONCURRENCY in the config file overrides the default.
+CONCURRENCY_STD = 4
+REQUEST_INTERVAL = 0.25
+CHUNK_SIZE = 64 * 1024
+
+# Number of papers that are downloaded at the same time. DOWNLOAD_WORKERS in the config
+# file overrides the default.
+DOWNLOAD_WORKERS_STD = 4
+
+# The listing pages can either be parsed with BeautifulSoup ('soup'), or with a streaming
+# parser ('stream') that reads the page while it downloads and never builds the whole
+# document tree. PARSER in the config file overrides the default. The streaming parser can
+# only be chosen with STREAM_PARSER_CHECKED, which is set once benchmarks/parser_parity.py
+# passed on pages captured from arxiv.org. Until then 'stream' falls back to BeautifulSoup.
+PARSER_STD = 'soup'
+STREAM_PARSER_CHECKED = False
+
+# Downloaded pages are kept in CACHE_PATH and revalidated with arxiv.org on the next run,
+# so that unchanged listings are not downloaded again. When the cache grows larger than
+# CACHE_MAX_BYTES the least recently used pages are removed.
+CACHE_PATH = HOME_PATH + '/.cache'
+CACHE_MAX_BYTES = 50 * 1024**2
+
+# Every paper that is shown is recorded in a database in STORE_PATH. With SKIP_SEEN = y
+# in the config file, papers that were already shown on an earlier day are skipped unless
+# a newer version of them appears.
+STORE_PATH = CACHE_PATH + '/papers.sqlite'
+
+# The list of arXiv categories from the front page is kept in CATALOGUE_PATH and only
+# downloaded again after CATALOGUE_TTL seconds. Catalogues saved in another format than
+# CATALOGUE_VERSION are ignored.
+CATALOGUE_PATH = CACHE_PATH + '/categories.json'
+CATALOGUE_TTL = 30 * 24 * 3600
+CATALOGUE_VERSION = 1
+
+# With PARSER = oai in the config file the papers are requested from the OAI-PMH interface
+# at OAI_URL (OAI_URL in the config file overrides it) instead of the listing pages. Only
+# papers that changed since the last run are returned, and the date of that run is kept
+# for each archive in OAI_STATE_PATH. Requests that are answered with 503 are repeated up to
+# OAI_RETRIES times after the time the server asks for.
+OAI_URL = 'https://oaipmh.arxiv.org/oai'
+OAI_STATE_PATH = CACHE_PATH + '/oai.json'
+OAI_RETRIES = 3
+
+# The digest is sent through SMTP_HOST on SMTP_PORT. If the server supports STARTTLS the
+# connection is encrypted, and a login is only attempted when EMAIL_LOGIN is set. Failed
+# deliveries are retried SMTP_RETRIES times, waiting SMTP_BACKOFF seconds before the first
+# retry and twice as long before each next one. With MAIL_QUEUE = y in the config file
+# messages are put in MAIL_QUEUE_PATH and sent in the background, and whatever could not
+# be sent stays there until the next run or `--send-queue`. SMTP_HOST and SMTP_PORT in the
+# config file override the defaults.
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 587
+SMTP_TIMEOUT = 30
+SMTP_RETRIES = 3
+SMTP_BACKOFF = 1.0
+MAIL_QUEUE_PATH = CACHE_PATH + '/mail'
+
+# With RANK = y in the config file the papers are sorted by how well they match your
+# interests. Every keyword in RANK_KEYWORDS ('keyword: weight; ...') that appears in the
+# title or abstract adds its weight, every author in RANK_AUTHORS adds RANK_AUTHOR_WEIGHT,
+# and the TF-IDF similarity to the last RANK_HISTORY downloaded papers adds up to
+# RANK_SIMILARITY_WEIGHT. Ranking needs numpy, and all papers are collected before any of
+# them is shown.
+RANK_AUTHOR_WEIGHT = 3
+RANK_SIMILARITY_WEIGHT = 5
+RANK_HISTORY = 500
+
+# Every paper written to a digest is added to a full-text index in SEARCH_INDEX_PATH that
+# `--search` looks through. Digests written before the index existed are imported the
+# first time they are searched. Matches in the title count SEARCH_WEIGHTS[0] times as much
+# as a match in the abstract, and matches in the authors SEARCH_WEIGHTS[1] times.
+SEARCH_INDEX_PATH = CACHE_PATH + '/search.sqlite'
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+SEARCH_RESULTS = 20
+
+# New papers are announced at ANNOUNCEMENT_TIME in ANNOUNCEMENT_ZONE on the weekdays in
+# ANNOUNCEMENT_DAYS (Monday is 0). In `--daemon' mode the listings are fetched right after,
+# and a listing that has not changed since the last announcement is fetched again up to
+# DAEMON_RETRIES times, waiting DAEMON_BACKOFF seconds and twice as long after every try.
+ANNOUNCEMENT_TIME = (20, 0)
+ANNOUNCEMENT_ZONE = 'America/New_York'
+ANNOUNCEMENT_DAYS = (6, 0, 1, 2, 3)
+DAEMON_RETRIES = 6
+DAEMON_BACKOFF = 60.0
+PREFETCH_PATH = CACHE_PATH + '/prefetched.json'
+
+# `--backfill' reads the archive listings BACKFILL_PAGE_SIZE papers at a time and keeps the
+# pages in BACKFILL_PATH until the digest is written, so an interrupted backfill resumes.
+BACKFILL_PAGE_SIZE = 500
+BACKFILL_PATH = CACHE_PATH + '/backfill'
+
+# With `prefetch = y' the PDFs of the PREFETCH_PAPERS best ranked papers and of the papers
+# by the authors in `rank_authors' are downloaded by PREFETCH_WORKERS threads while the
+# papers are shown. They are kept in PDF_CACHE_PATH under the hash of their content, and
+# when the cache grows larger than PDF_CACHE_MAX_BYTES the least recently used are removed.
+PREFETCH_PAPERS = 5
+PREFETCH_WORKERS = 2
+PDF_CACHE_PATH = CACHE_PATH + '/pdf'
+PDF_CACHE_MAX_BYTES = 500 * 1024**2
+
+# `--parquet' writes the papers in row groups of EXPORT_BATCH papers
+EXPORT_BATCH = 1000
+
 # ===============================================================================
 
 
@@ -80,12 +188,407 @@ class Color:
     self.UNDERLINE = '\033[4m'
     self.END = '\033[0m'
 
-# Set of global variables that keep track of how many papers have been filtered
+# Keeps track of how many papers have been filtered and of where the time of a run goes.
+# Counters and stage timings are recorded per category (None for the ones that don't
+# belong to a category, like downloading papers). It is shared between threads.
 class Statistics:
-  replaced = 0
-  cat_blacklist = 0
-  duplicate = 0
-  key_blacklist = 0
+
+  REJECTIONS = ['replaced', 'cat_blacklist', 'duplicate', 'key_blacklist', 'key_whitelist', 'seen']
+  STAGES = ['wait', 'latency', 'download', 'parse', 'filter']
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.values = {}
+
+  def add(self, name, amount=1, category=None):
+    with self.lock:
+      values = self.values.setdefault(category, {})
+      values[name] = values.get(name, 0) + amount
+
+  def get(self, name, category=None):
+    return self.values.get(category, {}).get(name, 0)
+
+  def total(self, name):
+    return sum(values.get(name, 0) for values in list(self.values.values()))
+
+  # Passes on the chunks of a page and records how long it took to receive them
+  def measure_download(self, chunks, category):
+
+    chunks = iter(chunks)
+    while True:
+      start = time.perf_counter()
+      chunk = next(chunks, None)
+      self.add('download', time.perf_counter() - start, category)
+      if chunk is None:
+        return
+      self.add('bytes', len(chunk), category)
+      yield chunk
+
+  # Passes on the entries of a listing and records the time it took to parse them, without
+  # the time spent waiting for the page to download in the meantime
+  def measure_parse(self, entries, category):
+
+    entries = iter(entries)
+    while True:
+      download = self.get('download', category)
+      start = time.perf_counter()
+      entry = next(entries, None)
+      self.add('parse', time.perf_counter() - start - (self.get('download', category) - download), category)
+      if entry is None:
+        return
+      yield entry
+
+  def as_dict(self):
+
+    with self.lock:
+      categories = {category: dict(values) for category, values in self.values.items() if category is not None}
+      totals = {name: self.total(name) for values in self.values.values() for name in values}
+
+    return {'date': date.today().isoformat(), 'categories': categories, 'total': totals}
+
+  def report(self):
+
+    row = '{:20}{:>9}{:>9}{:>10}{:>9}{:>9}{:>10}{:>8}  {}'
+    lines = [row.format('Category', 'wait', 'latency', 'download', 'parse', 'filter', 'size', 'shown', 'rejected')]
+
+    categories = [category for category in self.values if category is not None]
+    for category in categories + ['total']:
+      if category == 'total':
+        value = lambda name: self.total(name)
+      else:
+        value = lambda name: self.get(name, category)
+
+      rejections = ', '.join('{} {}'.format(reason, value(reason)) for reason in self.REJECTIONS if value(reason) > 0)
+      lines.append(row.format(category, *['{:.2f}s'.format(value(stage)) for stage in self.STAGES],
+                              '{:.2f}MB'.format(value('bytes') / 1024**2), value('yielded'), rejections or '-'))
+
+    if self.get('pdf_files') > 0:
+      lines.append('Downloaded {} papers with {:.2f} MB in {:.2f}s ({:.2f} MB/s)'.format(
+                   self.get('pdf_files'), self.get('pdf_bytes') / 1024**2, self.get('pdf_time'),
+                   self.get('pdf_bytes') / 1024**2 / max(self.get('pdf_time'), 1e-9)))
+
+    return '\n'.join(lines)
+
+# Statistics of the current run
+run_statistics = Statistics()
+
+
+# The caches are shared by all processes of the script, like a daemon and a regular run.
+# A file is written under a temporary name of the process and then renamed, so a reader
+# never sees half a file and processes don't take each other's temporary files.
+def write_json(path, data, **options):
+
+  temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+  with open(temporary_path, 'w') as json_file:
+    json.dump(data, json_file, **options)
+  os.replace(temporary_path, path)
+
+def read_json(path, default):
+
+  try:
+    with open(path, 'r') as json_file:
+      return json.load(json_file)
+  except (FileNotFoundError, ValueError):
+    return default
+
+# Lock around reading a shared file, merging it with the changes of this process and writing
+# it back, so that no process overwrites what another one wrote in the meantime. Where fcntl
+# is not available (Windows) the file is used without a lock.
+@contextmanager
+def file_lock(path):
+
+  try:
+    import fcntl
+  except ImportError:
+    yield
+    return
+
+  with open(path + '.lock', 'a') as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Persistent cache of downloaded pages keyed by their URL. Together with each page the
+# ETag and Last-Modified headers are saved so that the page can be revalidated with a
+# conditional request. The index is shared between threads and guarded by a lock.
+class HttpCache:
+
+  def __init__(self, path=CACHE_PATH + '/http', max_bytes=CACHE_MAX_BYTES):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.lock = threading.Lock()
+
+    os.makedirs(path, exist_ok=True)
+    self.index = read_json(path + '/index.json', {})
+
+  def lookup(self, url):
+
+    with self.lock:
+      entry = self.index.get(url)
+      if entry is not None and not os.path.exists(self.path + '/' + entry['file']):
+        del self.index[url]
+        return None
+      return entry
+
+  def read(self, url):
+
+    with self.lock:
+      entry = self.index[url]
+      with open(self.path + '/' + entry['file'], 'rb') as page_file:
+        content = page_file.read()
+      entry['used'] = time.time()
+      self.save_index()
+
+    return content
+
+  def store(self, url, content, headers):
+
+    filename = hashlib.sha1(url.encode()).hexdigest()
+    temporary_path = '{}/{}.{}.tmp'.format(self.path, filename, os.getpid())
+    with self.lock:
+      with open(temporary_path, 'wb') as page_file:
+        page_file.write(content)
+      os.replace(temporary_path, self.path + '/' + filename)
+
+      self.index[url] = {'file': filename, 'size': len(content), 'used': time.time(),
+                         'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+      self.save_index()
+
+  # Remove the least recently used pages until the cache fits into its size limit.
+  # Has to be called with the lock held.
+  def evict(self):
+
+    total_size = sum(entry['size'] for entry in self.index.values())
+    for url in sorted(self.index, key=lambda url: self.index[url]['used']):
+      if total_size <= self.max_bytes:
+        break
+      entry = self.index.pop(url)
+      total_size -= entry['size']
+      try:
+        os.remove(self.path + '/' + entry['file'])
+      except FileNotFoundError:
+        pass
+
+  # Merges the index with the one other processes saved, keeping the more recently used entry
+  # of a page and dropping the pages whose files were removed, and then makes the cache fit
+  # into its size limit again. Has to be called with the lock held.
+  def save_index(self):
+
+    with file_lock(self.path + '/index.json'):
+      index = read_json(self.path + '/index.json', {})
+      for url, entry in self.index.items():
+        if url not in index or index[url]['used'] <= entry['used']:
+          index[url] = entry
+      self.index = {url: entry for url, entry in index.items() if os.path.exists(self.path + '/' + entry['file'])}
+      self.evict()
+      write_json(self.path + '/index.json', self.index)
+
+# Downloads pages and makes sure requests to the same host are not sent more often than
+# once every `interval` seconds. It is shared between the threads fetching categories.
+# With a cache, pages are revalidated instead of downloaded again and in offline mode
+# they are only served from the cache.
+class Fetcher:
+
+  def __init__(self, interval=REQUEST_INTERVAL, cache=None, offline=False):
+    self.interval = interval
+    self.cache = cache
+    self.offline = offline
+    self.lock = threading.Lock()
+    self.next_request = {}
+
+  # Sleeps until the host may be asked again and returns how long that took
+  def wait_turn(self, url):
+
+    host = urlsplit(url).netloc
+    with self.lock:
+      now = time.monotonic()
+      start = max(now, self.next_request.get(host, now))
+      self.next_request[host] = start + self.interval
+
+    time.sleep(start - now)
+    return start - now
+
+  # Opens the page and returns a generator over its content in chunks of `chunk_size`
+  # bytes. Errors of the request are raised right away and not only once it is iterated.
+  # The time spent waiting for the turn of the host and the time until the server answered
+  # are added to `timings` under 'wait' and 'latency'.
+  def stream(self, url, chunk_size=CHUNK_SIZE, timings=None):
+
+    import urllib.request as urllib
+
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    entry = self.cache.lookup(url) if self.cache is not None else None
+
+    if self.offline:
+      if entry is None:
+        raise urllib.URLError("'{}' is not in the cache and the network is not used in offline mode.".format(url))
+      return self.cached_chunks(url, chunk_size)
+
+    if entry is not None:
+      if entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+      if entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    timings = timings if timings is not None else {}
+    timings['wait'] = timings.get('wait', 0) + self.wait_turn(url)
+    request = urllib.Request(url, headers=headers)
+    start = time.perf_counter()
+    try:
+      response = urllib.urlopen(request)
+    except urllib.HTTPError as error:
+      if error.code == 304 and entry is not None:
+        return self.cached_chunks(url, chunk_size)
+      raise
+    finally:
+      timings['latency'] = timings.get('latency', 0) + time.perf_counter() - start
+
+    return self.response_chunks(url, response, chunk_size)
+
+  def cached_chunks(self, url, chunk_size):
+
+    content = self.cache.read(url)
+    for start in range(0, len(content), chunk_size):
+      yield content[start:start + chunk_size]
+
+  # The chunks are passed on as they arrive and the page is saved in the cache once
+  # it is complete
+  def response_chunks(self, url, response, chunk_size):
+
+    content = []
+    with response:
+      while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+          break
+        content.append(chunk)
+        yield chunk
+
+    if self.cache is not None:
+      self.cache.store(url, b''.join(content), response.headers)
+
+  def fetch(self, url):
+    return b''.join(self.stream(url))
+
+  # A fetcher that keeps to the same rate limit but doesn't use the cache, for pages that
+  # should not push the daily listings out of it
+  def uncached(self):
+
+    fetcher = Fetcher(self.interval, offline=self.offline)
+    fetcher.lock = self.lock
+    fetcher.next_request = self.next_request
+
+    return fetcher
+
+
+# Persistent record of all papers that were shown in a digest. The arXiv id is the
+# primary key, so looking up a paper stays fast no matter how many days are recorded.
+class PaperStore:
+
+  def __init__(self, path=STORE_PATH, skip_seen=False):
+    self.skip_seen = skip_seen
+    self.today = date.today().isoformat()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self.connection = sqlite3.connect(path)
+    self.connection.executescript("""
+      PRAGMA journal_mode = WAL;
+      CREATE TABLE IF NOT EXISTS papers (
+        arxivid TEXT PRIMARY KEY,
+        version INTEGER,
+        categories TEXT,
+        title TEXT,
+        authors TEXT,
+        abstract TEXT,
+        first_seen TEXT,
+        last_seen TEXT
+      );
+      CREATE INDEX IF NOT EXISTS papers_first_seen ON papers (first_seen);
+    """)
+
+    # Stores from before downloads were recorded don't have the column yet
+    columns = [row[1] for row in self.connection.execute('PRAGMA table_info(papers)')]
+    if 'downloaded' not in columns:
+      self.connection.execute('ALTER TABLE papers ADD COLUMN downloaded TEXT')
+
+  # Returns the recorded version and the date the paper was first seen, or None
+  def lookup(self, arxivid):
+    return self.connection.execute('SELECT version, first_seen FROM papers WHERE arxivid = ?',
+                                   (arxivid,)).fetchone()
+
+  # A paper is old news if it was seen on an earlier day and this is not a newer version
+  def seen_before(self, arxivid, version):
+
+    recorded = self.lookup(arxivid)
+    if recorded is None or recorded[1] == self.today:
+      return False
+
+    return version is None or recorded[0] is None or version <= recorded[0]
+
+  def record(self, paper, version):
+
+    self.connection.execute("""
+      INSERT INTO papers (arxivid, version, categories, title, authors, abstract, first_seen, last_seen)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+      ON CONFLICT (arxivid) DO UPDATE SET
+        version = max(coalesce(version, 0), coalesce(excluded.version, 0)),
+        categories = excluded.categories, title = excluded.title, authors = excluded.authors,
+        abstract = excluded.abstract, last_seen = excluded.last_seen
+    """, (paper.arxivid, version, paper.categories, paper.title, paper.authors,
+          paper.abstract, self.today, self.today))
+
+  def mark_downloaded(self, arxivids, day=None):
+    self.connection.executemany('UPDATE papers SET downloaded = coalesce(downloaded, ?) WHERE arxivid = ?',
+                                [(day or self.today, arxivid) for arxivid in arxivids])
+
+  # Papers downloaded before the store recorded downloads are found by the arXiv ids in the
+  # names of the files in the Papers directories under `root`. They were downloaded on the
+  # day the directory is named after. Papers from before the store existed are added with
+  # the title and abstract from the digest of that day; without a digest they are left out.
+  def import_downloads(self, root):
+
+    import glob
+
+    for day in os.scandir(root) if os.path.isdir(root) else []:
+      if not os.path.isdir(day.path + '/Papers'):
+        continue
+
+      arxivids = set(re.findall(r'\d{4}\.\d{4,5}', ' '.join(os.listdir(day.path + '/Papers'))))
+      if any(self.lookup(arxivid) is None for arxivid in arxivids):
+        for path in sorted(glob.glob(day.path + '/digest-*.txt') + glob.glob(day.path + '/*/digest-*.txt')):
+          for paper in read_digest(path):
+            if paper.arxivid in arxivids:
+              self.connection.execute("""
+                INSERT OR IGNORE INTO papers (arxivid, categories, title, authors, abstract, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+              """, (paper.arxivid, paper.categories, paper.title, paper.authors, paper.abstract,
+                    day.name, day.name))
+
+      self.mark_downloaded(sorted(arxivids), day.name)
+
+  # The recorded papers with the given arXiv ids, in the same order
+  def papers(self, arxivids):
+
+    for arxivid in arxivids:
+      row = self.connection.execute('SELECT categories, title, abstract, authors FROM papers WHERE arxivid = ?',
+                                    (arxivid,)).fetchone()
+      if row is not None:
+        categories, title, abstract, authors = row
+        yield Paper(arxivid, categories or '', title or '', False, abstract or '', authors or '')
+
+  # Titles and abstracts of the `limit` most recently downloaded papers
+  def downloaded_papers(self, limit):
+    return self.connection.execute('SELECT title, abstract FROM papers WHERE downloaded IS NOT NULL '
+                                   'ORDER BY downloaded DESC LIMIT ?', (limit,)).fetchall()
+
+  def commit(self):
+    self.connection.commit()
+
+  def close(self):
+    self.connection.commit()
+    self.connection.close()
 
 
 def config_write(config_dict, home=HOME_PATH):
@@ -101,58 +604,215 @@ def config_write(config_dict, home=HOME_PATH):
   with open(home + '/.config/arxiv.conf', 'w') as configfile:
     config.write(configfile)
 
-def config_read(home=HOME_PATH):
+def config_read(home=HOME_PATH, path=None):
 
   config = configparser.ConfigParser()
 
   try:
-    config.read(home + '/.config/arxiv.conf')
+    config.read(path or home + '/.config/arxiv.conf')
     return config['SETTINGS']
   except:
     raise FileNotFoundError
 
+# The settings of one configuration file that decide which papers a user gets and where
+# their digest goes. Several profiles can be processed together in batch mode, so each
+# has its own digest directory and paper store, and optionally its own email address.
+class Profile:
 
-# Function that gets the list of categories from the arxiv front page. It curently works
-# in a somewhat ad-hoc way that depends on the way arxiv.org is laid out in html.
-# It may break in the future.
-def cat_list_prompt(color):
-  
-  request = urllib.Request('https://arxiv.org/', headers={'User-Agent': 'Mozilla/5.0'})
-  home_page_html = urllib.urlopen(request)
-  soup = BeautifulSoup(home_page_html, features='lxml')
+  def __init__(self, config, name=None, day=None):
+
+    def setting_list(key):
+      return [s.strip() for s in config.get(key, '').split(';') if s != '']
+
+    self.name = name
+    self.style = FilenameStyle(config.get('STYLE', STYLE_STD))
+    self.colored = (config.get('COLORED', 'y') == 'y')
+    self.cat_whitelist = setting_list('CATEGORY_WHITELIST')
+    self.cat_blacklist = setting_list('CATEGORY_BLACKLIST')
+    self.key_blacklist = setting_list('KEYWORD_BLACKLIST')
+    self.key_whitelist = setting_list('KEYWORD_WHITELIST')
+    self.key_filter = KeywordFilter(self.key_blacklist, self.key_whitelist, config.get('KEYWORD_MODE', 'substring'))
+    self.skip_seen = (config.get('SKIP_SEEN', 'n') == 'y')
+    self.rank = (config.get('RANK', 'n') == 'y')
+    self.rank_keywords = {}
+    for keyword in setting_list('RANK_KEYWORDS'):
+      keyword, _, weight = keyword.partition(':')
+      self.rank_keywords[keyword.strip().lower()] = float(weight) if weight.strip() else 1.0
+    self.rank_authors = setting_list('RANK_AUTHORS')
+    self.email = config.get('EMAIL', EMAIL)
+    self.fingerprint = hashlib.sha1(json.dumps(sorted(config.items())).encode()).hexdigest()
+
+    self.store_path = STORE_PATH if name is None else CACHE_PATH + '/papers-{}.sqlite'.format(name)
+
+    # The day is taken when the profile is read, as a daemon outlives the day it was started on.
+    # The daemon dates its digests by the day the papers are listed on instead.
+    self.day = day = day or date.today()
+    self.download_path = os.path.dirname(DOWNLOAD_PATH) + '/{}'.format(day)
+    if name is not None:
+      self.download_path += '/' + name
+    self.digest_path = self.download_path + '/digest-{}.txt'.format(day)
+
+  @classmethod
+  def from_file(cls, path, day=None):
+    return cls(config_read(path=path), os.path.splitext(os.path.basename(path))[0], day)
+
+
+def make_soup(markup):
+
+  import warnings
+  from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+
+  # Beatiful Soup throws a false warning when a website uses XHTML.
+  # We ignore this warning
+  warnings.filterwarnings('ignore', category=XMLParsedAsHTMLWarning)
+
+  return BeautifulSoup(markup, features='lxml')
+
+# The arXiv categories grouped by subject, as listed on the arxiv front page. The list is
+# scraped once and kept in CATALOGUE_PATH for CATALOGUE_TTL seconds, so the setup, the
+# check of the config file and `--categories` don't need to download the front page. If
+# it can't be refreshed, an outdated catalogue is used rather than none.
+class CategoryCatalogue:
 
-  home_page_links = soup.find_all('a', href=re.compile('/list/'))
+  def __init__(self, subjects, fetched=None):
+
+    self.subjects = subjects
+    self.fetched = fetched or time.time()
+    self.names = {category['id']: category['name'] for subject in subjects for category in subject['categories']}
+
+  def __contains__(self, category):
+    return category in self.names
+
+  def __iter__(self):
+    return iter(self.names)
+
+  def name(self, category):
+    return self.names.get(category, category)
+
+  # Categories whose id, name or subject contain `query`, ignoring case
+  def search(self, query=''):
+
+    query = query.lower()
+    return [(subject['name'], category) for subject in self.subjects for category in subject['categories']
+            if query in category['id'].lower() or query in category['name'].lower() or query in subject['name'].lower()]
+
+  def suggestions(self, category):
+
+    import difflib
+    return difflib.get_close_matches(category, self.names, n=3)
+
+  @classmethod
+  def load(cls, path=CATALOGUE_PATH, ttl=CATALOGUE_TTL, fetcher=None):
+
+    catalogue = None
+    try:
+      with open(path, 'r') as catalogue_file:
+        data = json.load(catalogue_file)
+      if data.get('version') == CATALOGUE_VERSION:
+        catalogue = cls(data['subjects'], data['fetched'])
+    except (OSError, ValueError, KeyError):
+      pass
+
+    if catalogue is not None and time.time() - catalogue.fetched < ttl:
+      return catalogue
+
+    try:
+      fresh = cls.scrape((fetcher or Fetcher()).fetch('https://arxiv.org/'))
+    except (OSError, ValueError):
+      if catalogue is None:
+        raise
+      return catalogue
+
+    fresh.save(path)
+    return fresh
+
+  def save(self, path=CATALOGUE_PATH):
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json(path, {'version': CATALOGUE_VERSION, 'fetched': self.fetched, 'subjects': self.subjects})
+
+  # It curently works in a somewhat ad-hoc way that depends on the way arxiv.org is laid
+  # out in html. It may break in the future.
+  @classmethod
+  def scrape(cls, home_page_html):
+
+    soup = make_soup(home_page_html)
+    home_page_links = soup.find_all('a', href=re.compile('/list/'))
+
+    subjects = []
+    try:
+      cls.scrape_links(home_page_links, subjects)
+    except (AttributeError, TypeError):
+      subjects = []
+
+    if not subjects:
+      raise ValueError('The categories could not be found on the arxiv front page.')
+
+    return cls(subjects)
+
+  @staticmethod
+  def scrape_links(home_page_links, subjects):
+
+    for link in home_page_links:
+
+      # A new overaching subject starts the first time its name appears
+      subject_name = link.parent.parent.previous_sibling.previous_sibling.get_text()
+      if not subjects or subjects[-1]['name'] != subject_name:
+        subjects.append({'name': subject_name, 'categories': []})
+      categories = subjects[-1]['categories']
+
+      # If the subject has subsubjects they appear close to the link for the new papers in that subsubject. The href of the link looks like /list/---?---/new so this is where we extract the id from, but the subsubject name has to be extracted from nearby and not the link itself. Beware that the subsubject name may not be the same as the subject name even if there is only one subsubject, as is the case of Computer Science, where additionally the link of the named subsubject leads to a help page instead.
+      link_name = link.get_text()
+      if 'new' in link_name:
+        subsubject_name = link.previous_sibling.previous_sibling.previous_sibling.previous_sibling.get_text()
+        categories.append({'id': link.get('href')[6:-4], 'name': subsubject_name, 'archive': True})
+
+      # The href of the link looks like '/list/---?---/recent' so that is how we extract the id
+      if link_name != 'new' and link_name != 'recent':
+        categories.append({'id': link.get('href')[6:-7], 'name': link_name, 'archive': False})
+
+# Prints the numbered list of categories and returns the category id of each number
+def cat_list_prompt(color, fetcher=None):
+
+  catalogue = CategoryCatalogue.load(fetcher=fetcher)
 
-  subject_prev = ''
   categories = {}
   n = 0
-  for link in home_page_links:
+  for subject in catalogue.subjects:
 
-    # Print the overaching subject name the first time it appears
-    subject_name = link.parent.parent.previous_sibling.previous_sibling.get_text()
-    if subject_name != subject_prev:
-      print('\n' + color.BOLD + color.UNDERLINE + '~ ~ ~ {} ~ ~ ~'.format(subject_name.upper()) + color.END)
-      subject_prev = subject_name
+    print('\n' + color.BOLD + color.UNDERLINE + '~ ~ ~ {} ~ ~ ~'.format(subject['name'].upper()) + color.END)
 
-    # If the subject has subsubjects they appear close to the link for the new papers in that subsubject. The href of the link looks like /list/---?---/new so this is where we extract the id from, but the subsubject name has to be extracted from nearby and not the link itself. Beware that the subsubject name may not be the same as the subject name even if there is only one subsubject, as is the case of Computer Science, where additionally the link of the named subsubject leads to a help page instead.
-    link_name = link.get_text()
-    if 'new' in link_name:
-      subsubject_name = link.previous_sibling.previous_sibling.previous_sibling.previous_sibling.get_text()
-      subsubject_id = link.get('href')[6:-4]
-      print('  {:4}: '.format(n) + color.UNDERLINE + subsubject_name + color.END + ' ({})'.format(subsubject_id) + ':')
-      categories[n] = subsubject_id
+    for category in subject['categories']:
+      if category['archive']:
+        print('  {:4}: '.format(n) + color.UNDERLINE + category['name'] + color.END + ' ({})'.format(category['id']) + ':')
+      else:
+        print('    {:4}: '.format(n) + category['name'] + ' ({})'.format(category['id']))
+      categories[n] = category['id']
       n += 1
-    
-    # The href of the link looks like '/list/---?---/recent' so that is how we extract the id
-    if link_name != 'new' and link_name != 'recent':
-      link_id = link.get('href')[6:-7]
-      print('    {:4}: '.format(n) + link_name + ' ({})'.format(link_id))
-      categories[n] = link_id
-      n += 1    
 
   return categories
 
-def setup(color, std_style=STYLE_STD):
+# Warns about categories in the config file that arXiv doesn't have, which would
+# otherwise only show up as a failed download or an empty listing
+def check_categories(profile, catalogue, color):
+
+  for category in profile.cat_whitelist + profile.cat_blacklist:
+    if category not in catalogue:
+      suggestions = catalogue.suggestions(category)
+      print(color.YELLOW + 'WARNING: ' + color.END + "'{}' is not an arXiv category.".format(category)
+            + (' Did you mean {}?'.format(', '.join(suggestions)) if suggestions else ''))
+
+# Prints the categories matching `query` grouped by subject
+def print_categories(catalogue, query, color):
+
+  subject_prev = None
+  for subject_name, category in catalogue.search(query):
+    if subject_name != subject_prev:
+      print(color.BOLD + subject_name + color.END)
+      subject_prev = subject_name
+    print('  {:20} {}'.format(category['id'], category['name']))
+
+def setup(color, std_style=STYLE_STD, fetcher=None):
 
   config = {}
 
@@ -196,7 +856,7 @@ def setup(color, std_style=STYLE_STD):
       print('{} is not a valid choice. Try again.'.format(color_choice))
 
 
-  categories = cat_list_prompt(color)
+  categories = cat_list_prompt(color, fetcher)
   while True:
 
     choices = input('Enter a space-separated list of the categories you want to subscribe ' +
@@ -270,100 +930,791 @@ def setup(color, std_style=STYLE_STD):
   return 0
 
 
-def on_blacklist(replaced, arxivid, categories, title, abstract, cat_blacklist, key_blacklist, papers):
-  
+# Keyword filter that is built once from the configuration. All keywords are compiled
+# into a single regular expression, so the title and abstract of a paper are lowercased
+# and scanned only once no matter how many keywords there are. In 'word' mode keywords
+# only match whole words. If a whitelist is given, a paper has to contain at least one
+# of its keywords to be shown.
+class KeywordFilter:
+
+  def __init__(self, blacklist=(), whitelist=(), mode='substring'):
+    self.blacklist = self.compile(blacklist, mode)
+    self.whitelist = self.compile(whitelist, mode)
+
+  # Lowercase the text and collapse line breaks and repeated spaces
+  @staticmethod
+  def normalize(text):
+    return ' '.join(text.lower().split())
+
+  # Turn the keywords into a pattern shaped like a trie, e.g. 'spin', 'spin chain' and
+  # 'spinor' become spin(?:\ chain|or)?. Python's regular expressions try the branches of
+  # an alternation one by one, so this keeps the work per character of text small.
+  @staticmethod
+  def trie_pattern(keywords):
+
+    trie = {}
+    for keyword in keywords:
+      node = trie
+      for char in keyword:
+        node = node.setdefault(char, {})
+      node[''] = {}
+
+    def node_pattern(node):
+      branches = [re.escape(char) + node_pattern(child) for char, child in sorted(node.items()) if char != '']
+      if len(branches) == 0:
+        return ''
+      if len(branches) == 1 and '' not in node:
+        return branches[0]
+      return '(?:' + '|'.join(branches) + ')' + ('?' if '' in node else '')
+
+    return node_pattern(trie)
+
+  @classmethod
+  def compile(cls, keywords, mode):
+
+    keywords = {cls.normalize(keyword) for keyword in keywords} - {''}
+    if len(keywords) == 0:
+      return None
+
+    pattern = cls.trie_pattern(keywords)
+    if mode == 'word':
+      pattern = r'(?<!\w)(?:' + pattern + r')(?!\w)'
+    elif mode != 'substring':
+      raise ValueError("ERROR: Unknown keyword mode '{}'. Use 'substring' or 'word'.".format(mode))
+
+    return re.compile(pattern)
+
+  # Returns the name of the statistic the paper is rejected under, or None if it passes
+  def check(self, title, abstract):
+
+    if self.blacklist is None and self.whitelist is None:
+      return None
+
+    # The newline can't be part of a keyword, so no match spans the title and abstract
+    text = self.normalize(title) + '\n' + self.normalize(abstract)
+
+    if self.blacklist is not None and self.blacklist.search(text):
+      return 'key_blacklist'
+    if self.whitelist is not None and not self.whitelist.search(text):
+      return 'key_whitelist'
+
+    return None
+
+# The checks are split in two so that the cheap ones, which only need the head of a
+# paper, can reject it before the rest of its metadata is parsed. A paper only counts as
+# a duplicate if it was accepted before, so it would have passed the category blacklist
+# anyway and every rejection is attributed to the same statistic as in a single pass.
+# With a store that skips seen papers, replaced papers are shown if they are a newer version
+# than the recorded one, and papers already shown on an earlier day are skipped.
+# Both return the reason a paper is rejected for, as it is counted in the statistics, or
+# None if it passes.
+def on_blacklist_head(replaced, arxivid, seen_ids, store=None, version=None):
+
   if replaced:
-    Statistics.replaced += 1
-    return True
+    recorded = store.lookup(arxivid) if store is not None and store.skip_seen and version is not None else None
+    if recorded is None or recorded[0] is None or version <= recorded[0]:
+      return 'replaced'
+
+  if arxivid in seen_ids:
+    return 'duplicate'
+
+  if store is not None and store.skip_seen and store.seen_before(arxivid, version):
+    return 'seen'
+
+  return None
+
+def on_blacklist(categories, title, abstract, cat_blacklist, key_filter):
 
   for catb in cat_blacklist:
     if catb in categories:
-      Statistics.cat_blacklist += 1
-      return True
-
-  for recorded_paper in papers:
-    if recorded_paper['arxivid'] == arxivid:
-      Statistics.duplicate += 1
-      return True
-
-  for keyword in key_blacklist:
-    if (keyword in title.lower()) or (keyword in abstract.lower()):
-      Statistics.key_blacklist += 1
-      return True
-    
-  return False
+      return 'cat_blacklist'
 
-# Generator that runs over a category and yields the data of a paper as a dictionary
-# if the paper is not blacklisted. This is also somewhat ad-hoc as above.
-def paper_data_scraper(category, cat_blacklist, key_blacklist, papers):
+  return key_filter.check(title, abstract)
 
-  cat_url = 'https://arxiv.org/list/' + category + '/new'
-  
-  try:
-    request = urllib.Request(cat_url, headers={'User-Agent': 'Mozilla/5.0'})
-    cat_html = urllib.urlopen(request)
-  except urllib.HTTPError:
-    raise urllib.HTTPError("'{}' not found.".format(cat_url))
-    sys.exit(0)
+# The version of a paper is taken from the links in its head, like the one to the HTML
+# version /html/2409.02159v2. New submissions without such a link are first versions.
+def paper_version(arxivid, links, replaced):
+
+  for link in links:
+    match = re.search(re.escape(arxivid) + r'v(\d+)$', link or '')
+    if match:
+      return int(match.group(1))
+
+  return None if replaced else 1
+
+# A paper in a listing parsed with BeautifulSoup. The fields are only extracted from the
+# head and metadata tags when they are used, so blacklisted papers are not fully parsed.
+class SoupEntry:
+
+  def __init__(self, paper_head, paper_meta):
+    self.paper_head = paper_head
+    self.paper_meta = paper_meta
+
+  @cached_property
+  def arxivid(self):
+    return self.paper_head.find_all('a', title='Abstract')[0].get_text().replace('arXiv:', '').strip()
+
+  @cached_property
+  def replaced(self):
+    return ('(replaced)' in self.paper_head.get_text())
+
+  @cached_property
+  def version(self):
+    links = [a.get('href') for a in self.paper_head.find_all('a')]
+    return paper_version(self.arxivid, links, self.replaced)
+
+  @cached_property
+  def categories(self):
+    categories = self.paper_meta.find('div', class_='list-subjects')
+    return categories.get_text().replace('Subjects:\n', '').strip()
+
+  @cached_property
+  def title(self):
+    title = self.paper_meta.find('div', class_='list-title')
+    return title.get_text().replace('Title:\n', '').strip()
+
+  @cached_property
+  def abstract(self):
+    try:
+      return self.paper_meta.find('p', class_='mathjax').get_text().replace('\n',' ').strip()
+    except AttributeError:
+      return '/'
+
+  # Fetch authors from the links with their names
+  @cached_property
+  def authors(self):
+    authors = self.paper_meta.find('div', class_='list-authors')
+    return ', '.join(a.get_text().strip() for a in authors.find_all('a'))
+
+  @cached_property
+  def comments(self):
+    try:
+      comments = self.paper_meta.find('div', class_='list-comments').get_text()
+      return comments.replace('Comments:\n', '').strip()
+    except AttributeError:
+      return '/'
+
+# Generator that parses a whole listing page with BeautifulSoup once the first paper is
+# requested. This is also somewhat ad-hoc as above.
+def soup_listing(chunks):
 
   # Scrape the webpage for all its text
-  soup = BeautifulSoup(cat_html, features='lxml')
+  soup = make_soup(b''.join(chunks))
 
   # Get paper head data and metadata
   papers_head = soup.find_all('dt')
   papers_meta = soup.find_all('div', class_='meta')
-  try:
-    zipped_papers_data = zip(papers_head, papers_meta, strict=True)
-  except ValueError:
+  if len(papers_head) != len(papers_meta):
     raise ValueError('ERROR: The number of found papers does not match the number of titles. It is very likely that this script does not work anymore.')
-    
-  for paper_head, paper_meta in zipped_papers_data:
 
-    arxivid = paper_head.find_all('a', title='Abstract')[0].get_text().replace('arXiv:', '').strip()
-    url = 'https://arxiv.org/pdf/' + arxivid
+  for paper_head, paper_meta in zip(papers_head, papers_meta):
+    yield SoupEntry(paper_head, paper_meta)
+
+# A paper in a listing parsed by ListingParser. All fields are filled in by the parser.
+class StreamEntry:
+
+  def __init__(self, arxivid, replaced, version, fields):
+    self.arxivid = arxivid
+    self.replaced = replaced
+    self.version = version
+    self.categories = fields.get('categories', '').replace('Subjects:\n', '').strip()
+    self.title = fields.get('title', '').replace('Title:\n', '').strip()
+    self.abstract = fields['abstract'].replace('\n', ' ').strip() if 'abstract' in fields else '/'
+    self.authors = ', '.join(author.strip() for author in fields.get('authors', []))
+    self.comments = fields['comments'].replace('Comments:\n', '').strip() if 'comments' in fields else '/'
+    self.day = fields.get('day')
+
+# Event based parser for listing pages. It follows the same tags as the BeautifulSoup path:
+# the <dt> with the paper head and the <div class="meta"> with its metadata. Every tag that
+# is open remembers which fields its text belongs to, and a finished paper is put into
+# `entries` as soon as its metadata closes, so papers can be used while the page downloads.
+# Archive listings are split into days by headings like 'Fri, 18 Oct 2024 (showing ...)',
+# whose date is given to the papers below them as `day`, and have a line with the total
+# number of papers in the listing above their pages.
+class ListingParser(HTMLParser):
+
+  # Tags that never have a closing tag in HTML
+  VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+               'param', 'source', 'track', 'wbr'}
+  META_FIELDS = {'list-title': 'title', 'list-authors': 'authors', 'list-comments': 'comments',
+                 'list-subjects': 'categories'}
+  MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+  DAY_HEADING = re.compile(r'(\d{1,2}) (' + '|'.join(MONTHS) + r') (\d{4})')
+  TOTAL = re.compile(r'Total of (\d+) entries')
+
+  # A page that continues a listing starts with the day of the last paper on the page before
+  def __init__(self, day=None):
+    super().__init__(convert_charrefs=True)
+    self.entries = []
+    self.heads = []
+    self.stack = []
+    self.head = None
+    self.meta = None
+    self.text = None
+    self.day = day
+    self.total = None
+
+  def handle_starttag(self, tag, attrs):
+
+    if tag in self.VOID_TAGS:
+      return
+
+    attrs = dict(attrs)
+    classes = (attrs.get('class') or '').split()
+    fields = self.stack[-1][1] if self.stack else ()
+    new_field = None
+
+    if tag == 'a' and 'head' in fields:
+      self.head['links'].append(attrs.get('href'))
+
+    if tag == 'dt':
+      self.head = {'head': [], 'arxivid': None, 'links': []}
+      new_field = 'head'
+    elif (tag == 'h3' or tag == 'div' and 'paging' in classes) and self.text is None:
+      self.text = []
+      new_field = 'heading' if tag == 'h3' else 'paging'
+    elif tag == 'a' and 'head' in fields and attrs.get('title') == 'Abstract' and self.head['arxivid'] is None:
+      self.head['arxivid'] = []
+      new_field = 'arxivid'
+    elif tag == 'div' and 'meta' in classes and self.meta is None:
+      self.meta = {}
+      new_field = 'meta'
+    elif self.meta is not None:
+      if tag == 'div':
+        for css_class, field in self.META_FIELDS.items():
+          if css_class in classes and field not in self.meta:
+            self.meta[field] = [] if field == 'authors' else ''
+            new_field = field
+            break
+      elif tag == 'p' and 'mathjax' in classes and 'abstract' not in self.meta:
+        self.meta['abstract'] = ''
+        new_field = 'abstract'
+      elif tag == 'a' and 'authors' in fields:
+        self.meta['authors'].append('')
+        new_field = 'author'
+
+    self.stack.append((tag, fields + (new_field,) if new_field else fields, new_field))
+
+  def handle_endtag(self, tag):
+
+    if tag in self.VOID_TAGS or tag not in (open_tag for open_tag, _, _ in self.stack):
+      return
+
+    # Tags that were left open are closed together with their parent
+    while self.stack:
+      open_tag, _, field = self.stack.pop()
+      self.close_field(field)
+      if open_tag == tag:
+        break
+
+  def close_field(self, field):
+
+    if field == 'head':
+      if self.head['arxivid'] is None:
+        raise ValueError('ERROR: A paper without an arXiv id was found. It is very likely that this script does not work anymore.')
+      arxivid = ''.join(self.head['arxivid']).replace('arXiv:', '').strip()
+      replaced = '(replaced)' in ''.join(self.head['head'])
+      self.heads.append((arxivid, replaced, paper_version(arxivid, self.head['links'], replaced)))
+      self.head = None
+
+    elif field == 'meta':
+      if not self.heads:
+        raise ValueError('ERROR: The number of found papers does not match the number of titles. It is very likely that this script does not work anymore.')
+      arxivid, replaced, version = self.heads.pop(0)
+      self.meta['day'] = self.day
+      self.entries.append(StreamEntry(arxivid, replaced, version, self.meta))
+      self.meta = None
+
+    elif field == 'heading':
+      match = self.DAY_HEADING.search(''.join(self.text))
+      self.day = match and '{}-{:02d}-{:02d}'.format(int(match[3]), self.MONTHS.index(match[2]) + 1, int(match[1]))
+      self.text = None
+
+    elif field == 'paging':
+      match = self.TOTAL.search(''.join(self.text))
+      self.total = int(match[1]) if match else self.total
+      self.text = None
+
+  def handle_data(self, data):
+
+    if not self.stack:
+      return
+
+    for field in self.stack[-1][1]:
+      if field == 'head' or field == 'arxivid':
+        self.head[field].append(data)
+      elif field == 'heading' or field == 'paging':
+        self.text.append(data)
+      elif field == 'author':
+        self.meta['authors'][-1] += data
+      elif field != 'meta' and field != 'authors':
+        self.meta[field] += data
+
+  def close(self):
+
+    super().close()
+    while self.stack:
+      self.close_field(self.stack.pop()[2])
+    if self.heads:
+      raise ValueError('ERROR: The number of found papers does not match the number of titles. It is very likely that this script does not work anymore.')
+
+# Generator that parses a listing page chunk by chunk and yields its papers as soon as
+# they are complete
+def stream_listing(chunks):
+
+  parser = ListingParser()
+  decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+  for chunk in chunks:
+    parser.feed(decoder.decode(chunk))
+    yield from parser.entries
+    parser.entries.clear()
+
+  parser.feed(decoder.decode(b'', final=True))
+  parser.close()
+  yield from parser.entries
+
+LISTING_PARSERS = {'soup': soup_listing, 'stream': stream_listing}
+
+OAI = '{http://www.openarchives.org/OAI/2.0/}'
+ARXIV_RAW = '{http://arxiv.org/OAI/arXivRaw/}'
+
+# Archives that are OAI sets of their own. The physics archives are in 'physics:<archive>'
+OAI_ARCHIVES = {'cs', 'econ', 'eess', 'math', 'q-bio', 'q-fin', 'stat'}
+
+# The OAI set that has the papers of a category, which is the whole archive
+def oai_set(category):
+
+  archive = category.split('.')[0]
+  return archive if archive in OAI_ARCHIVES else 'physics:' + archive
+
+# A record in the arXivRaw format as an entry like the ones from the listing pages, together
+# with the list of its categories. Deleted records give None.
+def oai_entry(record, names):
+
+  if record.find(OAI + 'header').get('status') == 'deleted':
+    return None
+
+  metadata = record.find(OAI + 'metadata/' + ARXIV_RAW + 'arXivRaw')
+  categories = metadata.findtext(ARXIV_RAW + 'categories', '').split()
+
+  text = lambda tag: ' '.join(metadata.findtext(ARXIV_RAW + tag, '').split())
+  version = len(metadata.findall(ARXIV_RAW + 'version'))
+
+  fields = {'categories': '; '.join('{} ({})'.format(names[cat], cat) if cat in names else cat for cat in categories),
+            'title': text('title'), 'authors': re.split(r',\s*(?:and\s+)?|\s+and\s+', text('authors'))}
+  if text('abstract'):
+    fields['abstract'] = text('abstract')
+  if text('comments'):
+    fields['comments'] = text('comments')
+
+  return categories, StreamEntry(text('id'), version > 1, version, fields)
+
+# Generator over the records of one page of a ListRecords answer as (categories, entry),
+# parsed while it downloads. The date of the answer and the resumption token for the next
+# page are put into `page`.
+def oai_records(chunks, names, page):
+
+  from xml.etree.ElementTree import XMLPullParser
+
+  parser = XMLPullParser(events=('end',))
+
+  def entries():
+    for _, element in parser.read_events():
+      if element.tag == OAI + 'responseDate':
+        page['date'] = element.text.strip()[:10]
+      elif element.tag == OAI + 'resumptionToken':
+        page['token'] = (element.text or '').strip()
+      elif element.tag == OAI + 'error' and element.get('code') != 'noRecordsMatch':
+        raise ValueError('OAI-PMH error {}: {}'.format(element.get('code'), (element.text or '').strip()))
+      elif element.tag == OAI + 'record':
+        record = oai_entry(element, names)
+        element.clear()
+        if record is not None:
+          yield record
+
+  for chunk in chunks:
+    parser.feed(chunk)
+    yield from entries()
+
+  parser.close()
+  yield from entries()
+
+# Requests the records of an OAI set that changed since its last harvest, following the
+# resumption tokens through all pages. The date of the first answer becomes the start of
+# the next harvest once all pages were read. The first harvest starts the day before.
+# A set is the whole archive, so it is harvested once per run and the categories of the
+# same archive are taken from that harvest. The pages are unique and never asked for
+# again, so they are not kept in the HTTP cache.
+class OaiSource:
+
+  def __init__(self, url=OAI_URL, state_path=OAI_STATE_PATH):
 
-    replaced = ('(replaced)' in paper_head.get_text())
-    
-    categories = paper_meta.find('div', class_='list-subjects')
-    categories = categories.get_text().replace('Subjects:\n', '').strip()
-
-    title = paper_meta.find('div', class_='list-title')
-    title = title.get_text().replace('Title:\n', '').strip()
+    self.url = url
+    self.state_path = state_path
+    self.lock = threading.Lock()
+    self.names = None
+    self.harvests = {}
 
     try:
-      abstract = paper_meta.find('p', class_='mathjax').get_text().replace('\n',' ').strip()
-    except AttributeError:
-      abstract = '/'
-    
+      with open(state_path, 'r') as state_file:
+        self.state = json.load(state_file)
+    except (OSError, ValueError):
+      self.state = {}
+
+  def category_names(self, fetcher):
+
+    with self.lock:
+      if self.names is None:
+        try:
+          self.names = CategoryCatalogue.load(fetcher=fetcher).names
+        except (OSError, ValueError):
+          self.names = {}
+
+    return self.names
+
+  def request(self, url, fetcher, timings=None):
+
+    import urllib.request as urllib
+
+    for attempt in range(OAI_RETRIES + 1):
+      try:
+        return fetcher.stream(url, timings=timings)
+      except urllib.HTTPError as error:
+        if error.code != 503 or attempt == OAI_RETRIES:
+          raise
+        delay = error.headers.get('Retry-After', '')
+        time.sleep(min(int(delay) if delay.isdigit() else 10, 60))
+
+  # Generator over the records of a harvest of `name`. Its time is counted for `category`,
+  # the category that asked for the set first.
+  def harvest(self, name, category, fetcher, statistics):
+
+    # States from before harvests were shared were saved for each category
+    start = self.state.get(name) or min((day for key, day in self.state.items() if oai_set(key) == name),
+                                        default=date.fromordinal(date.today().toordinal() - 1).isoformat())
+    query = {'verb': 'ListRecords', 'metadataPrefix': 'arXivRaw', 'from': start, 'set': name}
+    names = self.category_names(fetcher)
+    fetcher = fetcher.uncached()
+    harvest_date = None
+
+    while query is not None:
+
+      timings = {}
+      chunks = self.request(self.url + '?' + urlencode(query), fetcher, timings)
+      statistics.add('wait', timings.get('wait', 0), category)
+      statistics.add('latency', timings.get('latency', 0), category)
+
+      page = {}
+      chunks = statistics.measure_download(chunks, category)
+      yield from statistics.measure_parse(oai_records(chunks, names, page), category)
+
+      harvest_date = harvest_date or page.get('date')
+      query = {'verb': 'ListRecords', 'resumptionToken': page['token']} if page.get('token') else None
+
+    if harvest_date is not None:
+      self.save(name, harvest_date)
+
+  # The records of the set of `category`. A category that already got the records of the
+  # last harvest of its set starts a new one, which happens once per set in every run. The
+  # other categories of the set wait for that harvest and share its records.
+  def records(self, category, fetcher, statistics):
+
+    name = oai_set(category)
+    with self.lock:
+      harvest = self.harvests.get(name)
+      if harvest is None or category in harvest['categories']:
+        harvest = self.harvests[name] = {'lock': threading.Lock(), 'records': None, 'categories': set()}
+      harvest['categories'].add(category)
+
+    with harvest['lock']:
+      if harvest['records'] is None:
+        harvest['records'] = list(self.harvest(name, category, fetcher, statistics))
+
+    return harvest['records']
+
+  def listing(self, category, fetcher, statistics):
+
+    for categories, entry in self.records(category, fetcher, statistics):
+      if any(cat == category or cat.startswith(category + '.') for cat in categories):
+        yield entry
+
+  def save(self, name, harvest_date):
+
+    # Only the set of this harvest is changed in what other processes saved
+    with self.lock:
+      os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+      with file_lock(self.state_path):
+        self.state = read_json(self.state_path, {})
+        self.state[name] = harvest_date
+        write_json(self.state_path, self.state, indent=2)
+
+# The parser from the config file, which is the name of a listing parser or an OaiSource
+def config_parser(config):
+
+  parser = config.get('PARSER', PARSER_STD)
+  if parser == 'stream' and not STREAM_PARSER_CHECKED:
+    color = Color(config.get('COLORED', 'y') == 'y')
+    print(color.YELLOW + 'WARNING: ' + color.END + 'The streaming parser was not checked against pages from '
+          + 'arxiv.org yet (see benchmarks/parser_parity.py). BeautifulSoup is used instead.')
+    return PARSER_STD
+
+  return OaiSource(config.get('OAI_URL', OAI_URL)) if parser == 'oai' else parser
+
+# Downloads the listing of new papers in a category and parses it into its entries
+def fetch_listing(category, fetcher, parser=PARSER_STD, statistics=None):
+
+  import urllib.request as urllib
+
+  statistics = statistics or run_statistics
+  if isinstance(parser, OaiSource):
+    return parser.listing(category, fetcher, statistics)
+
+  cat_url = 'https://arxiv.org/list/' + category + '/new'
+
+  timings = {}
+  try:
+    chunks = fetcher.stream(cat_url, timings=timings)
+  except urllib.HTTPError as error:
+    raise urllib.HTTPError(cat_url, error.code, "'{}' not found.".format(cat_url), error.headers, None)
+  statistics.add('wait', timings.get('wait', 0), category)
+  statistics.add('latency', timings.get('latency', 0), category)
+
+  chunks = statistics.measure_download(chunks, category)
+  return statistics.measure_parse(LISTING_PARSERS[parser](chunks), category)
+
+# A paper as it is shown, written to the digest and downloaded. With slots a paper takes
+# less than half the memory of a dictionary with the same fields, which adds up when the
+# papers of many categories or days are kept. Most papers share one of a few category
+# lines, so those strings are interned.
+class Paper:
+
+  __slots__ = ('arxivid', 'categories', 'title', 'replaced', 'abstract', 'authors', 'comments')
+
+  def __init__(self, arxivid, categories='', title='', replaced=False, abstract='', authors='', comments=''):
+    self.arxivid = arxivid
+    self.categories = sys.intern(categories)
+    self.title = title
+    self.replaced = replaced
+    self.abstract = abstract
+    self.authors = authors
+    self.comments = comments
+
+  @property
+  def url(self):
+    return 'https://arxiv.org/pdf/' + self.arxivid
+
+  def as_dict(self):
+    return {field: getattr(self, field) for field in self.__slots__}
+
+# Generator that runs over a category and yields the data of a paper as a Paper
+# if the paper is not blacklisted. The listing can be passed in if it was already fetched.
+def paper_data_scraper(category, cat_blacklist, key_filter, seen_ids, fetcher=None, listing=None,
+                       parser=PARSER_STD, store=None, statistics=None):
+
+  statistics = statistics or run_statistics
+  if listing is None:
+    listing = fetch_listing(category, fetcher or Fetcher(), parser, statistics)
+
+  for entry in listing:
+
+    start = time.perf_counter()
+    arxivid = entry.arxivid
+    version = entry.version if store is not None else None
+    rejection = on_blacklist_head(entry.replaced, arxivid, seen_ids, store, version)
+
     # Check if the paper is on the blacklist before the data collection finishes
     # for a slight efficiency boost
-    if on_blacklist(replaced, arxivid, categories, title, abstract, cat_blacklist, key_blacklist, papers):
+    if rejection is None:
+      rejection = on_blacklist(entry.categories, entry.title, entry.abstract, cat_blacklist, key_filter)
+
+    statistics.add('filter', time.perf_counter() - start, category)
+    if rejection is not None:
+      statistics.add(rejection, 1, category)
       continue
-    
-    # Fetch authors from the links with their names
-    authors = paper_meta.find('div', class_='list-authors')
-    authors = [a.get_text().strip() for a in authors.find_all('a')]
-    authors = ', '.join(authors)
-        
-    try:
-      comments = paper_meta.find('div', class_='list-comments').get_text()
-      comments = comments.replace('Comments:\n', '').strip()
-    except AttributeError:
-      comments = '/'    
-    
-    yield {'arxivid': arxivid, 'categories': categories, 'title': title, 'replaced': replaced,
-            'abstract': abstract, 'authors': authors, 'comments': comments, 'url': url}
 
-def list_papers(cat_whitelist, cat_blacklist, key_blacklist):
+    seen_ids.add(arxivid)
+    paper = Paper(arxivid, entry.categories, entry.title, entry.replaced, entry.abstract, entry.authors,
+                  entry.comments)
+    if store is not None:
+      store.record(paper, version)
+
+    statistics.add('yielded', 1, category)
+    yield paper
+
+# Like executor.map, but only `ahead` items are processed before their results are
+# consumed, so that finished listings don't pile up in memory
+def bounded_map(executor, function, items, ahead):
+
+  futures = deque()
+  for item in items:
+    futures.append(executor.submit(function, item))
+    if len(futures) > ahead:
+      yield futures.popleft().result()
+
+  while futures:
+    yield futures.popleft().result()
+
+# Generator over the papers of all categories. The categories are downloaded and parsed by
+# a pool of `workers` threads, but they are filtered one after the other in the order of
+# the whitelist. This way duplicates and statistics are attributed exactly as if the
+# categories were fetched sequentially. With a single worker the listings are parsed
+# lazily while they download.
+def iter_papers(cat_whitelist, cat_blacklist, key_filter, workers=1, fetcher=None, parser=PARSER_STD,
+                store=None, statistics=None):
+
+  seen_ids = set()
+  fetcher = fetcher or Fetcher()
+  statistics = statistics or run_statistics
+
+  with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+    if workers > 1:
+      listings = bounded_map(executor, lambda cat: list(fetch_listing(cat, fetcher, parser, statistics)),
+                             cat_whitelist, workers)
+    else:
+      listings = (fetch_listing(cat, fetcher, parser, statistics) for cat in cat_whitelist)
+
+    for cat, listing in zip(cat_whitelist, listings):
+      yield from paper_data_scraper(cat, cat_blacklist, key_filter, seen_ids, listing=listing, store=store,
+                                    statistics=statistics)
+
+      if store is not None:
+        store.commit()
+
+# Scores papers against the interests of a user: weighted keywords, favourite authors and
+# the cosine similarity of the TF-IDF vector of a paper to the centroid of the downloaded
+# papers. The words of all papers are handled as one array of word ids, so term counts,
+# norms and dot products are single numpy calls for the whole listing.
+class Ranker:
+
+  # Words of at least two letters or digits, including hyphenated compound words
+  WORD = re.compile(r'\w[\w-]+')
+
+  def __init__(self, keywords, authors, history):
+
+    self.keywords = keywords
+    self.keyword_pattern = re.compile('|'.join(re.escape(keyword) for keyword in
+                                               sorted(keywords, key=len, reverse=True))) if keywords else None
+    self.authors = {author.lower() for author in authors}
+    self.history = [((title or '') + ' ' + (abstract or '')).lower() for title, abstract in history]
+
+  def similarities(self, texts):
+
+    import numpy as np
+    from itertools import chain
+
+    if not self.history:
+      return np.zeros(len(texts))
 
-  papers = []
-  total_papers = 0
+    # Word ids of the history followed by the listing, and the document of every word
+    tokens = [self.WORD.findall(text) for text in self.history + texts]
+    words = list(chain.from_iterable(tokens))
+    vocabulary = {word: index for index, word in enumerate(dict.fromkeys(words))}
+    ids = np.fromiter(map(vocabulary.__getitem__, words), dtype=np.int64, count=len(words))
+    documents = np.repeat(np.arange(len(tokens)), [len(document) for document in tokens])
 
-  for cat in cat_whitelist:
-    for paper in paper_data_scraper(cat, cat_blacklist, key_blacklist, papers):
-        papers.append(paper)
+    # TF-IDF weights of the distinct (document, word) pairs, normalized per document
+    size = len(vocabulary)
+    pairs, counts = np.unique(documents * size + ids, return_counts=True)
+    pair_documents, pair_ids = pairs // size, pairs % size
+    idf = np.log((1 + len(tokens)) / (1 + np.bincount(pair_ids, minlength=size))) + 1
+    weights = counts * idf[pair_ids]
+    weights /= np.sqrt(np.bincount(pair_documents, weights**2, minlength=len(tokens)))[pair_documents]
 
-  return papers, total_papers
+    history = pair_documents < len(self.history)
+    centroid = np.bincount(pair_ids[history], weights[history], minlength=size)
+    centroid /= max(np.linalg.norm(centroid), 1e-12)
+
+    listing = ~history
+    return np.bincount(pair_documents[listing] - len(self.history), weights[listing] * centroid[pair_ids[listing]],
+                       minlength=len(texts))
+
+  def scores(self, papers):
+
+    texts = [(paper.title + ' ' + paper.abstract).lower() for paper in papers]
+    scores = RANK_SIMILARITY_WEIGHT * self.similarities(texts)
+
+    # Every keyword counts once, however often it appears
+    if self.keyword_pattern is not None:
+      scores += [sum(self.keywords[match] for match in set(self.keyword_pattern.findall(text))) for text in texts]
+    if self.authors:
+      scores += [RANK_AUTHOR_WEIGHT * len(self.authors.intersection(author.strip().lower()
+                                                                    for author in paper.authors.split(',')))
+                 for paper in papers]
+
+    return scores
+
+  # The papers from the highest to the lowest score. Papers with the same score stay in
+  # the order of the listing.
+  def rank(self, papers):
+
+    import numpy as np
+
+    papers = list(papers)
+    if not papers:
+      return papers
+
+    return [papers[index] for index in np.argsort(-self.scores(papers), kind='stable')]
+
+# Ranker for a profile, or None if ranking is off or numpy is missing. Downloads from
+# before the store recorded them are looked up in the download directory first.
+def profile_ranker(profile, store, color):
+
+  if not profile.rank:
+    return None
+
+  try:
+    import numpy
+  except ImportError:
+    print(color.YELLOW + 'WARNING: ' + color.END + 'Ranking needs numpy (`pip install numpy`). '
+          + 'The papers are shown in the order of the listings.')
+    return None
+
+  store.import_downloads(os.path.dirname(DOWNLOAD_PATH))
+  return Ranker(profile.rank_keywords, profile.rank_authors, store.downloaded_papers(RANK_HISTORY))
+
+# A filename style compiled once into a regular expression that matches all of its
+# $attribute keywords, so that a filename is built in a single pass over the style
+class FilenameStyle:
+
+  def __init__(self, style):
+
+    self.style = style
+    self.attributes = [attribute for attribute in ATTRIBUTES if '$' + attribute in style]
+
+    keywords = sorted(self.attributes, key=len, reverse=True)
+    self.pattern = re.compile(r'\$(' + '|'.join(keywords) + ')') if keywords else None
+
+  def __str__(self):
+    return self.style
+
+  def filename(self, paper):
+
+    if self.pattern is None:
+      return self.style
+
+    return self.pattern.sub(lambda match: getattr(paper, match.group(1)), self.style)
+
+# Only the attributes used by the filename style are needed to download a paper later
+def download_record(paper, style):
+
+  fields = {attribute: getattr(paper, attribute) for attribute in style.attributes if attribute != 'url'}
+  fields['arxivid'] = paper.arxivid
+
+  return Paper(**fields)
+
+# Shows and writes every paper as soon as it is scraped. Only the download records of the
+# papers are kept, so memory doesn't grow with the full data of all papers.
+def stream_papers(papers, renderer, digest, style):
+
+  download_records = []
+  for paper in papers:
+    renderer.write(paper)
+    digest.write(paper)
+    download_records.append(download_record(paper, style))
+
+  renderer.close()
+
+  return download_records
 
 
 def download_prompt(number_of_papers, color):
@@ -391,10 +1742,298 @@ def download_prompt(number_of_papers, color):
 
   return download_list
 
-def downloader(download_list, papers, style):
+# Downloads papers with a pool of threads, where every thread keeps its connections open
+# between papers. A paper is written to `<filename>.part` first and only renamed once it is
+# complete, so a file with the final name is always complete and an interrupted download
+# is resumed with a range request the next time. The ETag or Last-Modified date of the file
+# is kept in `<filename>.part.validator` and sent with the range in If-Range, so that the
+# server sends the whole file again if the paper was replaced in the meantime.
+class PaperDownloader:
+
+  def __init__(self, workers=DOWNLOAD_WORKERS_STD, fetcher=None, statistics=None, show_progress=True):
+    self.workers = workers
+    self.fetcher = fetcher or Fetcher()
+    self.statistics = statistics or run_statistics
+    self.show_progress = show_progress
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    self.number_of_papers = 0
+    self.finished = 0
+    self.received_bytes = 0
+
+  def connection(self, scheme, host):
+
+    import http.client
+
+    if not hasattr(self.local, 'connections'):
+      self.local.connections = {}
+
+    if (scheme, host) not in self.local.connections:
+      connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+      self.local.connections[(scheme, host)] = connection_class(host, timeout=60)
+
+    return self.local.connections[(scheme, host)]
+
+  def request(self, url, headers, redirects=5):
+
+    import http.client
+
+    url_parts = urlsplit(url)
+    path = url_parts.path + ('?' + url_parts.query if url_parts.query else '')
+    connection = self.connection(url_parts.scheme, url_parts.netloc)
+
+    self.fetcher.wait_turn(url)
+    try:
+      connection.request('GET', path, headers=headers)
+      response = connection.getresponse()
+    except (http.client.HTTPException, ConnectionError):
+      # The server may have closed the connection in the meantime, so try a new one
+      connection.close()
+      connection.request('GET', path, headers=headers)
+      response = connection.getresponse()
+
+    if response.status in (301, 302, 303, 307, 308) and redirects > 0:
+      response.read()
+      return self.request(urljoin(url, response.getheader('Location')), headers, redirects - 1)
+
+    return response
+
+  def download(self, url, path):
+
+    import urllib.request as urllib
+
+    if os.path.exists(path):
+      return 'present'
+
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    part_path = path + '.part'
+    validator_path = part_path + '.validator'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    # Without a validator it can't be known if the partial file is of the same version
+    try:
+      with open(validator_path, 'r') as validator_file:
+        validator = validator_file.read().strip()
+    except FileNotFoundError:
+      validator = ''
+    if offset > 0 and validator:
+      headers['Range'] = 'bytes={}-'.format(offset)
+      headers['If-Range'] = validator
+
+    response = self.request(url, headers)
+
+    # The partial file can't be resumed, so start from the beginning
+    if response.status == 416:
+      response.read()
+      os.remove(part_path)
+      return self.download(url, path)
+
+    if response.status not in (200, 206):
+      response.read()
+      raise urllib.HTTPError(url, response.status, response.reason, response.headers, None)
+
+    # If-Range only works with a strong ETag, so weak ones are replaced by the date
+    if response.status == 200:
+      offset = 0
+      etag = response.getheader('ETag') or ''
+      validator = etag if etag and not etag.startswith('W/') else response.getheader('Last-Modified') or ''
+      with open(validator_path, 'w') as validator_file:
+        validator_file.write(validator)
+    expected_length = response.getheader('Content-Length')
+
+    written = 0
+    with open(part_path, 'ab' if offset > 0 else 'wb') as part_file:
+      while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+          break
+        part_file.write(chunk)
+        written += len(chunk)
+        self.progress(len(chunk))
+        self.statistics.add('pdf_bytes', len(chunk))
+
+    if expected_length is not None and written != int(expected_length):
+      raise ConnectionError('the download stopped after {} of {} bytes'.format(written, expected_length))
+
+    os.replace(part_path, path)
+    os.remove(validator_path)
+    self.statistics.add('pdf_files')
+    return 'downloaded'
+
+  def progress(self, received_bytes=0, finished=0):
+
+    with self.lock:
+      self.received_bytes += received_bytes
+      self.finished += finished
+      if self.show_progress:
+        print('\r[{}/{}] {:.2f} MB'.format(self.finished, self.number_of_papers, self.received_bytes / 1024**2),
+               end='', flush=True)
+
+  def download_paper(self, url, path):
+
+    import http.client
+
+    try:
+      result = self.download(url, path)
+    except (OSError, http.client.HTTPException) as error:
+      result = error
+    self.progress(finished=1)
+
+    return result
+
+  # Downloads the (url, path) pairs and returns the result for each of them in order:
+  # 'downloaded', 'present' or the exception that stopped the download
+  def download_all(self, downloads):
+
+    self.number_of_papers = len(downloads)
+    self.finished = 0
+    self.received_bytes = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+      results = list(executor.map(lambda download: self.download_paper(*download), downloads))
+    self.statistics.add('pdf_time', time.perf_counter() - start)
+    print()
+
+    return results
+
+# PDFs kept under the SHA-256 of their content, so that a file is only stored once however
+# many urls lead to it. The index maps urls to files and is shared between threads.
+class PdfCache:
+
+  def __init__(self, path=PDF_CACHE_PATH, max_bytes=PDF_CACHE_MAX_BYTES):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.lock = threading.Lock()
+
+    os.makedirs(path, exist_ok=True)
+    index = read_json(path + '/index.json', {})
+    self.urls = index.get('urls', {})
+    self.files = index.get('files', {})
+
+  def __contains__(self, url):
+    with self.lock:
+      return url in self.urls and os.path.exists(self.path + '/' + self.urls[url])
+
+  # Moves a downloaded file into the cache
+  def add(self, url, path):
+
+    content_hash = hashlib.sha256()
+    with open(path, 'rb') as pdf_file:
+      for chunk in iter(lambda: pdf_file.read(CHUNK_SIZE), b''):
+        content_hash.update(chunk)
+    filename = content_hash.hexdigest()
+
+    with self.lock:
+      os.replace(path, self.path + '/' + filename)
+      self.urls[url] = filename
+      self.files[filename] = {'size': os.path.getsize(self.path + '/' + filename), 'used': time.time()}
+      self.save_index()
+
+  # Puts the file of `url` at `path`, as a hard link where the file system allows it, and
+  # tells if the cache had it
+  def link(self, url, path):
+
+    with self.lock:
+      filename = self.urls.get(url)
+      if filename is None or not os.path.exists(self.path + '/' + filename):
+        return False
+
+      if not os.path.exists(path):
+        try:
+          os.link(self.path + '/' + filename, path)
+        except OSError:
+          shutil.copyfile(self.path + '/' + filename, path)
+      self.files[filename]['used'] = time.time()
+      self.save_index()
+
+    return True
+
+  # Remove the least recently used files until the cache fits into its size limit.
+  # Has to be called with the lock held.
+  def evict(self):
+
+    total_size = sum(entry['size'] for entry in self.files.values())
+    for filename in sorted(self.files, key=lambda filename: self.files[filename]['used']):
+      if total_size <= self.max_bytes:
+        break
+      total_size -= self.files.pop(filename)['size']
+      try:
+        os.remove(self.path + '/' + filename)
+      except FileNotFoundError:
+        pass
+
+    self.urls = {url: filename for url, filename in self.urls.items() if filename in self.files}
+
+  # Merges the index with the one other processes saved like HttpCache does and makes the
+  # cache fit into its size limit again. Has to be called with the lock held.
+  def save_index(self):
+
+    with file_lock(self.path + '/index.json'):
+      index = read_json(self.path + '/index.json', {})
+      files = index.get('files', {})
+      for filename, entry in self.files.items():
+        if filename not in files or files[filename]['used'] <= entry['used']:
+          files[filename] = entry
+      self.files = {filename: entry for filename, entry in files.items()
+                    if os.path.exists(self.path + '/' + filename)}
+      self.urls = dict(index.get('urls', {}), **self.urls)
+      self.evict()
+      write_json(self.path + '/index.json', {'urls': self.urls, 'files': self.files})
+
+# Downloads the PDFs of the papers that are likely to be chosen into a PdfCache while the
+# papers are shown. Once papers are chosen the downloads that have not started are dropped,
+# and the ones that did are waited for if their paper was chosen.
+class Prefetcher:
+
+  def __init__(self, cache, authors, fetcher=None, workers=PREFETCH_WORKERS):
+    self.cache = cache
+    self.authors = {author.lower() for author in authors}
+    self.downloader = PaperDownloader(workers, fetcher, Statistics(), show_progress=False)
+    self.executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    self.futures = {}
+
+  # Passes on the papers and prefetches the first `best` of them and the ones by favourite authors
+  def watch(self, papers, best=0):
+
+    for number, paper in enumerate(papers):
+      if number < best or self.authors.intersection(author.strip().lower() for author in paper.authors.split(',')):
+        if paper.url not in self.futures and paper.url not in self.cache:
+          self.futures[paper.url] = self.executor.submit(self.prefetch, paper)
+      yield paper
+
+  def prefetch(self, paper):
+
+    path = '{}/{}.pdf'.format(self.cache.path, paper.arxivid.replace('/', '_'))
+    self.downloader.download(paper.url, path)
+    self.cache.add(paper.url, path)
+
+  # Puts the PDF of `url` at `path` if it was prefetched and tells if it was
+  def link(self, url, path):
+
+    import http.client
+
+    future = self.futures.get(url)
+    if future is not None and not future.cancelled():
+      try:
+        future.result()
+      except (OSError, http.client.HTTPException):
+        pass
+
+    return self.cache.link(url, path)
+
+  def stop(self):
+    self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Downloads the chosen papers into the day's Papers directory and returns the arXiv ids of
+# the ones that are there now
+def downloader(download_list, papers, style, workers=DOWNLOAD_WORKERS_STD, fetcher=None, store=None,
+               prefetcher=None):
+
+  if prefetcher is not None:
+    prefetcher.stop()
 
   if len(download_list) == 0:
-    return 0
+    return []
   
   try:
     os.mkdir(DOWNLOAD_PATH + '/Papers')
@@ -403,44 +2042,73 @@ def downloader(download_list, papers, style):
 
   # Get maximum filename length supported by OS to avoid errors with filenames
   # that are too long to be displayed
-  NAME_MAX = subprocess.check_output('getconf NAME_MAX /', shell=True).strip()
-  NAME_MAX = int(NAME_MAX)
+  try:
+    NAME_MAX = os.pathconf(DOWNLOAD_PATH + '/Papers', 'PC_NAME_MAX')
+  except (AttributeError, OSError, ValueError):
+    NAME_MAX = 255
 
+  downloads = []
   for paper_index in download_list:
 
     # Construct filename according to style
-    filename = style
-    for style_option in ATTRIBUTES:
-      filename = filename.replace('$' + style_option, papers[paper_index][style_option])
-    
-    if len(filename) > NAME_MAX:
+    filename = style.filename(papers[paper_index])
+
+    # Leave space for the '.part.validator' suffix of unfinished downloads
+    if len((filename + '.part.validator').encode()) > NAME_MAX:
       print('WARNING: Your file system supports file names up to {} characters'.format(NAME_MAX) +
              ', but your chosen style gives a name longer than that. Hence the arXiv id number ' +
-             'will be used to name the file: {}.pdf'.format(papers[paper_index]['arxivid']))
-      filename = papers[paper_index]['arxivid'] + '.pdf'
+             'will be used to name the file: {}.pdf'.format(papers[paper_index].arxivid))
+      filename = papers[paper_index].arxivid + '.pdf'
 
-    # Download the file using wget
-    subprocess.call(['wget', '--quiet', '--show-progress', '--header',
-                     'User-Agent: Mozilla/5.0', '--output-document',
-                     DOWNLOAD_PATH + '/Papers/' + filename, papers[paper_index]['url']])
-  
-  return 0
+    downloads.append((papers[paper_index].url, DOWNLOAD_PATH + '/Papers/' + filename))
+
+  # Prefetched papers are only linked and the rest is downloaded as usual
+  results = [None] * len(downloads)
+  if prefetcher is not None:
+    for number, (url, path) in enumerate(downloads):
+      if prefetcher.link(url, path):
+        results[number] = 'prefetched'
+        run_statistics.add('pdf_prefetched')
+
+  missing = [number for number, result in enumerate(results) if result is None]
+  if missing:
+    for number, result in zip(missing, PaperDownloader(workers, fetcher).download_all([downloads[number]
+                                                                                        for number in missing])):
+      results[number] = result
+  for (url, path), result in zip(downloads, results):
+    if isinstance(result, Exception):
+      print('WARNING: {} could not be downloaded ({}). '.format(url, result) +
+             'Run the download again to resume it.')
+
+  # Downloaded papers are what ranking compares new papers with
+  downloaded = [papers[paper_index].arxivid for paper_index, result in zip(download_list, results)
+                if not isinstance(result, Exception)]
+  if store is not None:
+    store.mark_downloaded(downloaded)
+
+  return downloaded
 
 
-def draw_bar(number_passed, color, bar_length=120):
+def draw_bar(number_passed, color, bar_length=120, output=None, statistics=None):
 
   # if the bar length is too big it won't fit well in the terminal
   terminal_width = shutil.get_terminal_size().columns
   if bar_length + 10 > terminal_width:
     bar_length = terminal_width - 10
 
-  total_number = (Statistics.replaced + Statistics.cat_blacklist + Statistics.duplicate
-                   + Statistics.key_blacklist + number_passed)
-
-  rounded_replaced = max(round(bar_length * Statistics.replaced / total_number), 1)
-  rounded_cat_blacklist = max(round(bar_length * Statistics.cat_blacklist / total_number), 1)
-  rounded_duplicate = max(round(bar_length * Statistics.duplicate / total_number), 1)
-  rounded_key_blacklist = max(round(bar_length * Statistics.key_blacklist / total_number), 1)
+  statistics = statistics or run_statistics
+  replaced = statistics.total('replaced')
+  cat_blacklisted = statistics.total('cat_blacklist')
+  # Papers rejected by the keyword whitelist are shown together with the blacklisted ones
+  key_filtered = statistics.total('key_blacklist') + statistics.total('key_whitelist')
+  # Papers already seen on an earlier day are shown together with the duplicates
+  duplicates = statistics.total('duplicate') + statistics.total('seen')
+  total_number = (replaced + cat_blacklisted + duplicates + key_filtered + number_passed)
+
+  rounded_replaced = max(round(bar_length * replaced / total_number), 1)
+  rounded_cat_blacklist = max(round(bar_length * cat_blacklisted / total_number), 1)
+  rounded_duplicate = max(round(bar_length * duplicates / total_number), 1)
+  rounded_key_blacklist = max(round(bar_length * key_filtered / total_number), 1)
   rounded_passed = bar_length - rounded_replaced - rounded_cat_blacklist - rounded_duplicate - rounded_key_blacklist
 
   bar = (color.BLUE + '[' +'=' * (rounded_passed - 1) + '|' + color.END +
@@ -455,76 +2123,908 @@ def draw_bar(number_passed, color, bar_length=120):
          color.YELLOW + '(Duplicates) ' + color.END +
          color.PURPLE + '(Blacklisted Category) ' + color.END +
          color.RED + '(Blacklisted Keywords) ' + color.END +
-         color.BLACK + '(Replaced Papers)' + color.END)
-  print(' ' * ((terminal_width - bar_length - 2) // 2) + bar + color.WHITE + number + color.END)
+         color.BLACK + '(Replaced Papers)' + color.END, file=output)
+  print(' ' * ((terminal_width - bar_length - 2) // 2) + bar + color.WHITE + number + color.END, file=output)
+
+# Renders papers for the terminal into a buffer that is written out in large pieces, instead
+# of printing every line of every paper separately. The layout of a paper is built into a
+# template once. The buffer is flushed when it is large or when the last flush was more
+# than FLUSH_INTERVAL seconds ago, so streamed papers still show up right away. The output
+# can be piped into a pager, if `less` is installed, and the abstracts can be wrapped to
+# the width of the terminal.
+class TerminalRenderer:
+
+  FLUSH_INTERVAL = 0.05
+
+  def __init__(self, color, pager=False, wrap=False, statistics=None):
+    self.color = color
+    self.statistics = statistics
+    self.number_of_papers = 0
+    self.last_flush = time.monotonic()
+    self.buffer = io.StringIO()
+
+    self.width = shutil.get_terminal_size().columns if wrap else None
+    self.pager = None
+    if pager:
+      try:
+        self.pager = subprocess.Popen(['less', '-R'], stdin=subprocess.PIPE, text=True)
+      except OSError:
+        print(color.YELLOW + 'WARNING: ' + color.END + 'The pager `less` could not be started. '
+              + 'The papers are shown without it.')
+    self.output = self.pager.stdin if self.pager is not None else sys.stdout
+
+    self.template = ('\n\n' + color.BOLD + color.UNDERLINE + color.BLUE + '{0:5}' + color.END + ' '
+                     + color.ITALIC + color.WHITE + '{1}' + color.END + color.RED + ' ({2})' + color.END + '\n'
+                     + 6 * ' ' + color.BLACK + 'Authors: {3}' + color.END + '\n'
+                     + 6 * ' ' + color.BLACK + 'Subjects: {4}' + color.END + '\n'
+                     + 6 * ' ' + color.BLACK + 'Comments: {5}' + color.END + '\n\n'
+                     + color.BLUE + '{6}' + color.END + '\n\n'
+                     + color.GREEN + '-' * 167 + color.END + '\n')
+
+  def write(self, paper):
+
+    abstract = paper.abstract
+    if self.width is not None:
+      abstract = textwrap.fill(abstract, self.width)
+
+    self.buffer.write(self.template.format(self.number_of_papers, paper.title, paper.arxivid,
+                                           paper.authors, paper.categories, paper.comments, abstract))
+    self.number_of_papers += 1
+
+    if self.buffer.tell() > CHUNK_SIZE or time.monotonic() - self.last_flush > self.FLUSH_INTERVAL:
+      self.flush()
+
+  def flush(self):
+
+    if self.output is not None:
+      try:
+        self.output.write(self.buffer.getvalue())
+        self.output.flush()
+      except BrokenPipeError:
+        # The pager was closed, the rest of the papers are not shown anymore
+        self.output = None
+
+    self.buffer.seek(0)
+    self.buffer.truncate()
+    self.last_flush = time.monotonic()
+
+  # Shows the filter statistics below the papers and waits until the pager is closed
+  def close(self):
+
+    draw_bar(self.number_of_papers, self.color, output=self.buffer, statistics=self.statistics)
+    self.flush()
+
+    if self.pager is not None:
+      try:
+        self.pager.stdin.close()
+      except BrokenPipeError:
+        pass
+      self.pager.wait()
+
+def print_to_terminal(papers, color, pager=False, wrap=False, statistics=None):
+
+  renderer = TerminalRenderer(color, pager, wrap, statistics)
+  for paper in papers:
+    renderer.write(paper)
+
+  renderer.close()
+
+# Writes the digest in a single buffered pass. It goes to a temporary file next to the
+# digest first that replaces it once it is complete, so neither the mailer nor anyone else
+# reading the digest ever sees a half-written file.
+class DigestWriter:
+
+  def __init__(self, path, cat_whitelist, cat_blacklist, key_blacklist, index=None, period=None, day=None):
+    self.path = path
+    self.index = index
+    self.day = day or date.today()
+    self.temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    self.number_of_papers = 0
+
+    self.output = open(self.temporary_path, 'w', buffering=CHUNK_SIZE)
+    self.output.write(('This is the daily arXiv digest for the date {}. '.format(self.day) if period is None
+                       else 'This is the arXiv digest for the dates {}. '.format(period))
+                      + 'The categories that have been accessed were: {}. '.format(cat_whitelist)
+                      + 'The ones that were blacklisted were: {}. '.format(cat_blacklist)
+                      + 'The blacklisted keywords were: {}'.format(key_blacklist)
+                      + 'This can be changed in the file {}/.config/arxiv.conf.\n\n'.format(HOME_PATH))
+
+  def write(self, paper):
+
+    self.output.write('\n\n' + '{:5}:'.format(self.number_of_papers) + paper.title
+                      + ' (' + paper.arxivid + ')' + '\n'
+                      + 6 * ' ' + 'Authors: ' + paper.authors + '\n'
+                      + 6 * ' ' + 'Subjects:' + paper.categories + '\n'
+                      + 6 * ' ' + 'Comments:' + paper.comments + '\n\n'
+                      + paper.abstract + '\n\n'
+                      + '---------------------------------------------------------------------')
+    self.number_of_papers += 1
+
+    if self.index is not None:
+      self.index.add(paper, self.day.isoformat())
+
+  def close(self):
+
+    self.output.close()
+    os.replace(self.temporary_path, self.path)
+
+    if self.index is not None:
+      self.index.mark_imported(self.path)
+      self.index.commit()
 
-def print_to_terminal(papers, color):
-  
-  for i, paper in enumerate(papers):
+  # Throw the unfinished digest away and leave the previous one untouched
+  def discard(self):
 
-    print('\n')
-    print(color.BOLD + color.UNDERLINE + color.BLUE + '{:5}'.format(i) + color.END + ' ' + color.ITALIC + color.WHITE
-           + paper['title'] + color.END + color.RED + ' (' + paper['arxivid'] + ')' + color.END)
-    print(6 * ' ' + color.BLACK + 'Authors: ' + paper['authors'] + color.END)
-    print(6 * ' ' + color.BLACK + 'Subjects: ' + paper['categories'] + color.END)
-    print(6 * ' ' + color.BLACK + 'Comments: ' + paper['comments'] + color.END + '\n')        
-    print(color.BLUE + paper['abstract'] + color.END + '\n')
-    print(color.GREEN + '-' * 167 + color.END)
+    self.output.close()
+    os.remove(self.temporary_path)
 
-  draw_bar(len(papers), color)
+    if self.index is not None:
+      self.index.rollback()
 
-def print_to_file(papers):
-  
-  try:
-    os.remove(DOWNLOAD_PATH + '/digest-{}.txt'.format(date.today()))
-  except FileNotFoundError:
-    pass
+  def __enter__(self):
+    return self
 
-  with open(DOWNLOAD_PATH + '/digest-{}.txt'.format(date.today()), 'a+') as output:
-    output.write('This is the daily arXiv digest for the date {}. '.format(date.today())
-                 + 'The categories that have been accessed were: {}. '.format(cat_whitelist)
-                 + 'The ones that were blacklisted were: {}. '.format(cat_blacklist)
-                 + 'The blacklisted keywords were: {}'.format(key_blacklist)
-                 + 'This can be changed in the file {}/.config/arxiv.conf.\n\n'.format(HOME_PATH))
-  
-  for i, paper in enumerate(papers):
+  def __exit__(self, exception_type, exception, traceback):
+
+    if exception_type is None:
+      self.close()
+    else:
+      self.discard()
+
+def print_to_file(papers, cat_whitelist, cat_blacklist, key_blacklist, path=None, index=None):
+
+  path = path or DOWNLOAD_PATH + '/digest-{}.txt'.format(date.today())
+
+  with DigestWriter(path, cat_whitelist, cat_blacklist, key_blacklist, index) as digest:
+    for paper in papers:
+      digest.write(paper)
+
+# Writers for the papers in formats that other programs can read. Like the digest, a file
+# is written under a temporary name and only gets its final name once it is complete.
+# Every record has the date of the digest besides the fields of the paper.
+class JsonlExporter:
+
+  def __init__(self, path):
+    self.path = path
+    self.temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    self.today = date.today().isoformat()
+    self.output = open(self.temporary_path, 'w', buffering=CHUNK_SIZE)
+
+  def write(self, paper):
+    self.output.write(json.dumps(dict(paper.as_dict(), date=self.today), ensure_ascii=False) + '\n')
+
+  def close(self):
+    self.output.close()
+    os.replace(self.temporary_path, self.path)
+
+# Parquet files of all digests can be read together as one table in a fraction of the time it
+# takes to parse the digests, e.g. with `pyarrow.dataset.dataset(paths)`. Papers are collected
+# into row groups of `batch_size` papers, so only one row group is kept in memory.
+class ParquetExporter:
+
+  def __init__(self, path, batch_size=EXPORT_BATCH):
+
+    import pyarrow
+    import pyarrow.parquet
+
+    self.path = path
+    self.temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    self.batch_size = batch_size
+    self.today = date.today()
+    self.rows = {name: [] for name in ('date',) + Paper.__slots__}
+    self.schema = pyarrow.schema([('date', pyarrow.date32()), ('arxivid', pyarrow.string()),
+                                  ('categories', pyarrow.string()), ('title', pyarrow.string()),
+                                  ('replaced', pyarrow.bool_()), ('abstract', pyarrow.string()),
+                                  ('authors', pyarrow.string()), ('comments', pyarrow.string())])
+    self.output = pyarrow.parquet.ParquetWriter(self.temporary_path, self.schema)
+
+  def write(self, paper):
+
+    self.rows['date'].append(self.today)
+    for name in Paper.__slots__:
+      self.rows[name].append(getattr(paper, name))
+
+    if len(self.rows['date']) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+
+    import pyarrow
+
+    if self.rows['date']:
+      self.output.write_batch(pyarrow.RecordBatch.from_pydict(self.rows, schema=self.schema))
+      for column in self.rows.values():
+        column.clear()
+
+  def close(self):
+    self.flush()
+    self.output.close()
+    os.replace(self.temporary_path, self.path)
+
+# BibTeX entries for papers, with the year taken from the arXiv id and the primary category
+# from the first category of the paper, which is either 'Name (id)' or only the id. The
+# characters of titles and authors that are special in LaTeX outside of math are escaped,
+# unless they already are, like in 'Q\&A'. Braces are kept for math and grouping, and only
+# escaped if they don't match, which BibTeX could not read.
+class BibtexExporter:
+
+  SPECIAL = re.compile(r'(?<!\\)([&%#])')
+
+  @classmethod
+  def escape(cls, text):
+
+    text = cls.SPECIAL.sub(r'\\\1', text)
+    depth = 0
+    for character in text:
+      depth += {'{': 1, '}': -1}.get(character, 0)
+      if depth < 0:
+        break
+
+    return text if depth == 0 else re.sub(r'(?<!\\)([{}])', r'\\\1', text)
+
+  def __init__(self, path):
+    self.path = path
+    self.temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    self.output = open(self.temporary_path, 'w')
+
+  def write(self, paper):
+
+    number = paper.arxivid.split('/')[-1]
+    year = int(number[:2]) + (1900 if int(number[:2]) > 90 and '/' in paper.arxivid else 2000)
+    primary_class = re.search(r'\(([^()]+)\)', paper.categories) or re.match(r'([^;\s]+)', paper.categories)
+    authors = ' and '.join(author.strip() for author in paper.authors.split(',') if author.strip())
+
+    self.output.write('@misc{{{},\n'.format(paper.arxivid.replace('/', ':'))
+                      + '  title = {{{}}},\n'.format(self.escape(paper.title))
+                      + '  author = {{{}}},\n'.format(self.escape(authors))
+                      + '  year = {{{}}},\n'.format(year)
+                      + '  eprint = {{{}}},\n'.format(paper.arxivid)
+                      + '  archivePrefix = {arXiv},\n'
+                      + ('  primaryClass = {{{}}},\n'.format(primary_class[1]) if primary_class else '')
+                      + '  url = {{https://arxiv.org/abs/{}}}\n'.format(paper.arxivid)
+                      + '}\n\n')
+
+  def close(self):
+    self.output.close()
+    os.replace(self.temporary_path, self.path)
+
+# The exporters chosen with `--jsonl' and `--parquet'. Without a path the file is written
+# next to the digest.
+def exporters(profile, color):
+
+  base_path = os.path.splitext(profile.digest_path)[0]
+  writers = []
+
+  if '--jsonl' in sys.argv:
+    writers.append(JsonlExporter(argument_value('--jsonl', base_path + '.jsonl')))
+
+  if '--parquet' in sys.argv:
+    try:
+      writers.append(ParquetExporter(argument_value('--parquet', base_path + '.parquet')))
+    except ImportError:
+      print(color.YELLOW + 'WARNING: ' + color.END + 'Parquet files need pyarrow (`pip install pyarrow`). '
+            + 'No Parquet file is written.')
+
+  return writers
+
+# Passes on the papers and writes each of them with the exporters as it goes by
+def export_papers(papers, writers):
+
+  for paper in papers:
+    for writer in writers:
+      writer.write(paper)
+    yield paper
+
+# One paper in a digest file as written by DigestWriter
+DIGEST_ENTRY = re.compile(r'\s*\d+:(?P<title>.*?) \((?P<arxivid>[^()\n]*)\)\n {6}Authors: (?P<authors>.*?)\n'
+                          r' {6}Subjects:(?P<categories>.*?)\n {6}Comments:(?P<comments>.*?)\n\n(?P<abstract>.*?)\s*$',
+                          re.DOTALL)
+
+# Generator over the papers of a digest file written by DigestWriter
+def read_digest(path):
+
+  with open(path, 'r') as digest:
+    header, _, papers = digest.read().partition('\n')
+
+  for entry in papers.split('\n\n' + '-' * 69):
+    match = DIGEST_ENTRY.match(entry)
+    if match:
+      yield Paper(match['arxivid'], match['categories'], match['title'], False, match['abstract'],
+                  match['authors'], match['comments'])
+
+# Full-text index of all papers that were written to a digest. The papers are kept in a
+# table with one row per arXiv id, the last digest they appeared in, and an FTS5 table over
+# their title, authors and abstract that triggers keep up to date.
+class SearchIndex:
+
+  def __init__(self, path=SEARCH_INDEX_PATH):
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self.connection = sqlite3.connect(path)
+    self.connection.executescript("""
+      PRAGMA journal_mode = WAL;
+      CREATE TABLE IF NOT EXISTS papers (
+        id INTEGER PRIMARY KEY,
+        arxivid TEXT UNIQUE,
+        digest_date TEXT,
+        title TEXT,
+        authors TEXT,
+        abstract TEXT,
+        categories TEXT,
+        comments TEXT
+      );
+      CREATE VIRTUAL TABLE IF NOT EXISTS papers_text USING fts5(
+        title, authors, abstract, content = 'papers', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+      );
+      CREATE TRIGGER IF NOT EXISTS papers_insert AFTER INSERT ON papers BEGIN
+        INSERT INTO papers_text (rowid, title, authors, abstract)
+        VALUES (new.id, new.title, new.authors, new.abstract);
+      END;
+      CREATE TRIGGER IF NOT EXISTS papers_update AFTER UPDATE ON papers BEGIN
+        INSERT INTO papers_text (papers_text, rowid, title, authors, abstract)
+        VALUES ('delete', old.id, old.title, old.authors, old.abstract);
+        INSERT INTO papers_text (rowid, title, authors, abstract)
+        VALUES (new.id, new.title, new.authors, new.abstract);
+      END;
+      CREATE TABLE IF NOT EXISTS imported (path TEXT PRIMARY KEY);
+    """)
+
+  def add(self, paper, digest_date):
+
+    self.connection.execute("""
+      INSERT INTO papers (arxivid, digest_date, title, authors, abstract, categories, comments)
+      VALUES (?, ?, ?, ?, ?, ?, ?)
+      ON CONFLICT (arxivid) DO UPDATE SET
+        digest_date = max(digest_date, excluded.digest_date), title = excluded.title,
+        authors = excluded.authors, abstract = excluded.abstract, categories = excluded.categories,
+        comments = excluded.comments
+    """, (paper.arxivid, digest_date, paper.title, paper.authors, paper.abstract, paper.categories,
+          paper.comments))
+
+  def mark_imported(self, path):
+    self.connection.execute('INSERT OR IGNORE INTO imported VALUES (?)', (os.path.abspath(path),))
+
+  # Adds the papers of a digest file written by DigestWriter
+  def import_digest(self, path):
+
+    digest_date = re.search(r'digest-(\d{4}-\d{2}-\d{2})\.txt$', path).group(1)
+    for paper in read_digest(path):
+      self.add(paper, digest_date)
+
+    self.mark_imported(path)
+
+  # Imports the digests under `root` that are not in the index yet and returns their number
+  def import_digests(self, root):
+
+    import glob
+
+    imported = {row[0] for row in self.connection.execute('SELECT path FROM imported')}
+    paths = [path for path in sorted(glob.glob(root + '/*/digest-*.txt') + glob.glob(root + '/*/*/digest-*.txt'))
+             if os.path.abspath(path) not in imported]
+
+    for path in paths:
+      self.import_digest(os.path.abspath(path))
+    self.commit()
+
+    return len(paths)
+
+  # The best matches for the words in `query`, ranked with bm25. Every word has to appear
+  # and is looked up literally, so characters like '(' or '-' are not FTS5 operators.
+  def search(self, query, limit=SEARCH_RESULTS):
+
+    words = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+    if not words:
+      return []
+
+    return self.connection.execute("""
+      SELECT papers.digest_date, papers.arxivid, papers.title, papers.authors
+      FROM papers_text JOIN papers ON papers.id = papers_text.rowid
+      WHERE papers_text MATCH ?
+      ORDER BY bm25(papers_text, ?, ?, ?)
+      LIMIT ?
+    """, (words, *SEARCH_WEIGHTS, limit)).fetchall()
+
+  def commit(self):
+    self.connection.commit()
+
+  def rollback(self):
+    self.connection.rollback()
+
+  def close(self):
+    self.connection.commit()
+    self.connection.close()
+
+def print_search(index, query, color):
+
+  results = index.search(query)
+  for digest_date, arxivid, title, authors in results:
+    print(color.BLACK + digest_date + color.END + '  ' + color.RED + arxivid + color.END + '  '
+          + color.BOLD + title + color.END)
+    print(24 * ' ' + color.BLACK + authors + color.END)
+
+  if not results:
+    print("No papers match '{}'.".format(query))
+
+# Sends messages over one SMTP connection that is opened on the first message and reused
+# for the following ones, so a batch of digests pays for the handshake and login once.
+# Dropped connections, timeouts and temporary (4xx) answers are retried with exponential
+# backoff on a new connection. Permanent errors are raised right away.
+class Mailer:
+
+  def __init__(self, host=SMTP_HOST, port=SMTP_PORT, login=EMAIL, password=EMAIL_LOGIN,
+               retries=SMTP_RETRIES, backoff=SMTP_BACKOFF):
+
+    self.host = host
+    self.port = port
+    self.login = login
+    self.password = password
+    self.retries = retries
+    self.backoff = backoff
+    self.server = None
 
-    with open(DOWNLOAD_PATH + '/digest-{}.txt'.format(date.today()), 'a+') as output:
-      output.write('\n\n' + '{:5}:'.format(i) + paper['title']
-                    + ' (' + paper['arxivid'] + ')' + '\n')
-      output.write(6 * ' ' + 'Authors: ' + paper['authors'] + '\n')
-      output.write(6 * ' ' + 'Subjects:' + paper['categories'] + '\n')
-      output.write(6 * ' ' + 'Comments:' + paper['comments'] + '\n\n')
-      output.write(paper['abstract'] + '\n\n')
-      output.write('---------------------------------------------------------------------')
+  def __enter__(self):
+    return self
 
-def send_email(color, from_email=EMAIL, from_password=EMAIL_LOGIN, to_email=EMAIL):
+  def __exit__(self, *exc_info):
+    self.close()
 
-  if from_email is None:
+  def connect(self):
+
+    import smtplib
+
+    self.server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+    self.server.ehlo()
+
+    if self.server.has_extn('starttls'):
+      self.server.starttls()
+      self.server.ehlo()
+    if self.password:
+      self.server.login(self.login, self.password)
+
+  def send(self, message):
+
+    import smtplib
+
+    for attempt in range(self.retries + 1):
+      try:
+        if self.server is None:
+          self.connect()
+        self.server.send_message(message)
+        return
+      except smtplib.SMTPRecipientsRefused:
+        raise
+      except smtplib.SMTPResponseException as error:
+        if not 400 <= error.smtp_code < 500:
+          raise
+        failure = error
+      except OSError as error:
+        failure = error
+
+      self.close()
+      if attempt == self.retries:
+        raise failure
+      time.sleep(self.backoff * 2**attempt)
+
+  def close(self):
+
+    import smtplib
+
+    if self.server is not None:
+      try:
+        self.server.quit()
+      except (smtplib.SMTPException, OSError):
+        self.server.close()
+      self.server = None
+
+# Messages waiting to be sent, one file per message. Files are written under a temporary
+# name and renamed, so a message is either complete or not in the queue at all, and they
+# are sent in the order they were queued.
+class MailQueue:
+
+  def __init__(self, path=MAIL_QUEUE_PATH):
+
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+
+  def put(self, message):
+
+    data = message.as_bytes()
+    name = '{}/{:.6f}-{}.eml'.format(self.path, time.time(), hashlib.sha1(data).hexdigest()[:12])
+
+    with open(name + '.tmp', 'wb') as message_file:
+      message_file.write(data)
+    os.replace(name + '.tmp', name)
+
+  def messages(self):
+    return sorted(name for name in os.listdir(self.path) if name.endswith('.eml'))
+
+  # Sends queued messages until the queue is empty or one of them fails and returns the
+  # number of sent messages. Messages that were not sent stay in the queue. The daemon and
+  # regular runs flush the same queue, so only one of them sends at a time.
+  def flush(self, mailer):
+
+    import smtplib
+    from email import message_from_binary_file
+
+    sent = 0
+    try:
+      with file_lock(self.path):
+        for name in self.messages():
+          with open(self.path + '/' + name, 'rb') as message_file:
+            mailer.send(message_from_binary_file(message_file))
+          os.remove(self.path + '/' + name)
+          sent += 1
+    except (smtplib.SMTPException, OSError):
+      pass
+    finally:
+      mailer.close()
+
+    return sent
+
+# The subject has the date of the digest, which the daemon sets to the day its papers are listed
+def digest_message(path, from_email, to_email):
+
+  from email.mime.text import MIMEText
+
+  with open(path, 'r') as output:
+    email_data = MIMEText(output.read())
+
+  day = re.search(r'digest-(\d{4}-\d{2}-\d{2})\.txt$', path)
+  email_data['Subject'] = 'arXiv Digest {}'.format(day.group(1) if day else date.today())
+  email_data['From'] = from_email
+  email_data['To'] = to_email
+
+  return email_data
+
+# Sends the digest with `mailer`, or puts it in `queue` to be sent later
+def send_email(color, from_email=EMAIL, from_password=EMAIL_LOGIN, to_email=EMAIL, path=None,
+               mailer=None, queue=None):
+
+  import smtplib
+
+  if not from_email or not to_email:
     return 0
 
   try:
-    with open(DOWNLOAD_PATH + '/digest-{}.txt'.format(date.today()), 'r') as output:
-      message = output.read()
+    email_data = digest_message(path or DOWNLOAD_PATH + '/digest-{}.txt'.format(date.today()), from_email, to_email)
   except IOError:
     print(color.YELLOW + 'WARNING: Email will not be sent because message is empty.' + color.END)
     return 0
-  
-  email_data = MIMEText(message)
-  email_data['Subject'] = 'arXiv Digest {}'.format(date.today())
-  email_data['From'] = from_email
-  email_data['To'] = to_email
 
-  server = smtplib.SMTP('smtp.gmail.com', 587)
-  server.ehlo()
-  server.starttls()
-  server.login(from_email, from_password)
-  server.sendmail(from_email, to_email, email_data.as_string())
-  server.close()
+  if queue is not None:
+    queue.put(email_data)
+    return 0
+
+  mailer = mailer or Mailer(login=from_email, password=from_password)
+  try:
+    mailer.send(email_data)
+  except (smtplib.SMTPException, OSError) as error:
+    print(color.YELLOW + 'WARNING: Email to {} could not be sent: {}'.format(to_email, error) + color.END)
 
   return 0
 
 
+# Fetches the listings of the categories concurrently, each category once
+def fetch_listings(categories, workers=1, fetcher=None, parser=PARSER_STD, statistics=None):
+
+  fetcher = fetcher or Fetcher()
+  categories = list(dict.fromkeys(categories))
+
+  with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+    return dict(zip(categories, executor.map(lambda cat: list(fetch_listing(cat, fetcher, parser, statistics)),
+                                             categories)))
+
+# Filters and ranks the papers of a profile from listings that were already fetched,
+# writes its digest and returns the papers. The email is sent from EMAIL if the day's
+# directory of the profile is new, like in a regular run. The filter statistics of a named
+# profile are recorded under '<profile>:<category>'.
+def write_profile(profile, listings, statistics=None, mailer=None, queue=None, index=None):
+
+  statistics = statistics or run_statistics
+
+  try:
+    os.makedirs(profile.download_path)
+    send = True
+  except FileExistsError:
+    send = False
+
+  seen_ids = set()
+  store = PaperStore(profile.store_path, profile.skip_seen)
+  papers = (paper for cat in profile.cat_whitelist
+            for paper in paper_data_scraper(cat if profile.name is None else '{}:{}'.format(profile.name, cat),
+                                            profile.cat_blacklist, profile.key_filter, seen_ids,
+                                            listing=listings[cat], store=store, statistics=statistics))
+  ranker = profile_ranker(profile, store, Color(False))
+  papers = ranker.rank(papers) if ranker is not None else list(papers)
+
+  with DigestWriter(profile.digest_path, profile.cat_whitelist, profile.cat_blacklist,
+                    profile.key_blacklist, index, day=profile.day) as digest:
+    for paper in papers:
+      digest.write(paper)
+  store.close()
+
+  print('{}{} papers written to {}'.format('' if profile.name is None else '[{}] '.format(profile.name),
+                                           digest.number_of_papers, profile.digest_path))
+  if send:
+    send_email(Color(False), to_email=profile.email, path=profile.digest_path, mailer=mailer, queue=queue)
+
+  return papers
+
+# Fetches every category of all profiles once and then writes the digest of each profile
+# from the same parsed listings, so the cost of fetching grows with the number of distinct
+# categories and not with the number of profiles. Emails are sent over a single connection.
+def batch(profiles, workers=1, fetcher=None, parser=PARSER_STD, statistics=None, mailer=None, queue=None,
+          index=None):
+
+  mailer = mailer or Mailer()
+  listings = fetch_listings([cat for profile in profiles for cat in profile.cat_whitelist], workers, fetcher,
+                            parser, statistics)
+
+  for profile in profiles:
+    write_profile(profile, listings, statistics, mailer, queue, index)
+
+  mailer.close()
+  if queue is not None:
+    queue.flush(mailer)
+
+# Timestamps of the last announcement of new papers at or before `now` and of the next
+# one after it. The announcement time is kept in its own time zone, so it moves with
+# daylight saving time there.
+def announcements(now=None):
+
+  from datetime import datetime, time as day_time, timedelta
+  from zoneinfo import ZoneInfo
+
+  now = datetime.fromtimestamp(time.time() if now is None else now, ZoneInfo(ANNOUNCEMENT_ZONE))
+  times = [datetime.combine(now.date() + timedelta(days=days), day_time(*ANNOUNCEMENT_TIME), now.tzinfo)
+           for days in range(-7, 8)]
+  times = [announcement for announcement in times if announcement.weekday() in ANNOUNCEMENT_DAYS]
+
+  return (max(announcement for announcement in times if announcement <= now).timestamp(),
+          min(announcement for announcement in times if announcement > now).timestamp())
+
+# The day the papers of an announcement are listed as new, the day after it in New York.
+# For users in America this is the morning after the announcement.
+def announcement_day(announcement):
+
+  from datetime import datetime, timedelta
+  from zoneinfo import ZoneInfo
+
+  return (datetime.fromtimestamp(announcement, ZoneInfo(ANNOUNCEMENT_ZONE)) + timedelta(days=1)).date()
+
+# Papers of each profile that the daemon collected after an announcement, so that a
+# later run shows them without fetching anything. Results are found by the fingerprint
+# of the profile's settings and only used until the next announcement. The fingerprints
+# of the listings tell a new announcement from the last one.
+class PrefetchCache:
+
+  def __init__(self, path=PREFETCH_PATH):
+    self.path = path
+
+    data = read_json(path, {})
+    self.listings = data.get('listings', {})
+    self.profiles = data.get('profiles', {})
+
+  @staticmethod
+  def listing_fingerprint(listing):
+    return hashlib.sha1(' '.join(sorted(entry.arxivid for entry in listing)).encode()).hexdigest()
+
+  # Categories whose listing is empty or the same as at the last announcement
+  def unchanged(self, listings):
+    return [cat for cat, listing in listings.items()
+            if not listing or self.listings.get(cat) == self.listing_fingerprint(listing)]
+
+  def add(self, profile, papers, statistics):
+    self.profiles[profile.fingerprint] = {'time': time.time(), 'statistics': statistics.as_dict()['total'],
+                                          'papers': [paper.as_dict() for paper in papers]}
+
+  # Returns the papers and the statistics of the profile or None if there are none that
+  # were collected after the last announcement
+  def papers(self, profile):
+
+    result = self.profiles.get(profile.fingerprint)
+    if result is None or result['time'] < announcements()[0]:
+      return None
+
+    statistics = Statistics()
+    for name, value in result['statistics'].items():
+      statistics.add(name, value)
+
+    return [Paper(**paper) for paper in result['papers']], statistics
+
+  # Saves the new listings and results together with the ones other processes saved
+  def save(self, listings):
+
+    last_announcement = announcements()[0]
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    with file_lock(self.path):
+      data = read_json(self.path, {})
+      self.listings = dict(data.get('listings', {}), **{cat: self.listing_fingerprint(listing)
+                                                         for cat, listing in listings.items()})
+      self.profiles = {fingerprint: result for fingerprint, result in dict(data.get('profiles', {}),
+                                                                             **self.profiles).items()
+                       if result['time'] >= last_announcement}
+      write_json(self.path, {'listings': self.listings, 'profiles': self.profiles})
+
+# Runs forever and writes the digests of the profiles right after each announcement, dated
+# by the day its papers are listed on. A
+# category whose listing has not changed yet is fetched again with exponential backoff,
+# and after the last try the digests are written from the categories that did change,
+# so nothing is written on days without an announcement. The configuration
+# files are read again for every announcement, so changes to them are picked up.
+def daemon(paths, workers=1, fetcher=None, parser=PARSER_STD, mailer=None, queue=None):
+
+  fetcher = fetcher or Fetcher()
+  mailer = mailer or Mailer()
+
+  while True:
+
+    next_announcement = announcements()[1]
+    print('Waiting for the announcement at {}.'.format(time.strftime('%Y-%m-%d %H:%M', time.localtime(next_announcement))))
+    time.sleep(max(next_announcement - time.time(), 0))
+
+    day = announcement_day(next_announcement)
+    profiles = [Profile.from_file(path, day) for path in paths] if paths else [Profile(config_read(), day=day)]
+    categories = list(dict.fromkeys(cat for profile in profiles for cat in profile.cat_whitelist))
+    cache = PrefetchCache()
+    listings = {}
+
+    for attempt in range(DAEMON_RETRIES + 1):
+      try:
+        stale = [cat for cat in categories if cat not in listings] + cache.unchanged(listings)
+        listings.update(fetch_listings(stale, workers, fetcher, parser, Statistics()))
+      except OSError as error:
+        print('Fetching the listings failed: {}'.format(error))
+      unchanged = [cat for cat in categories if cat not in listings] + cache.unchanged(listings)
+      if not unchanged or attempt == DAEMON_RETRIES:
+        break
+      print('Not announced yet: {}'.format(', '.join(unchanged)))
+      time.sleep(DAEMON_BACKOFF * 2 ** attempt)
+
+    # Papers of listings that never changed were already in the last digests
+    listings = {cat: listing for cat, listing in listings.items() if cat not in unchanged}
+    index = SearchIndex()
+    for profile in profiles:
+      if any(cat in listings for cat in profile.cat_whitelist):
+        statistics = Statistics()
+        papers = write_profile(profile, {cat: listings.get(cat, []) for cat in profile.cat_whitelist}, statistics,
+                               mailer, queue, index)
+        cache.add(profile, papers, statistics)
+    index.close()
+    cache.save(listings)
+
+    mailer.close()
+    if queue is not None:
+      queue.flush(mailer)
+
+# The archive listings of a category that cover the days from `start` to `end`. Only the
+# listing of the past week is divided into days, so older papers are read month by month.
+def archive_listings(category, start, end):
+
+  if start.toordinal() >= date.today().toordinal() - 6:
+    return [category + '/pastweek']
+
+  months = []
+  year, month = start.year, start.month
+  while (year, month) <= (end.year, end.month):
+    months.append('{}/{}-{:02d}'.format(category, year, month))
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+  return months
+
+# Reads archive listings page by page. Every downloaded page is saved in a directory of the
+# backfill, so that running the same backfill again only downloads the pages that are
+# missing. Only `workers` pages are downloaded ahead of the one that is parsed, which keeps
+# the memory bounded no matter how long the listings are.
+class Backfill:
+
+  def __init__(self, start, end, categories, workers=1, fetcher=None, path=BACKFILL_PATH,
+               page_size=BACKFILL_PAGE_SIZE):
+
+    self.start = start.isoformat()
+    self.end = end.isoformat()
+    self.workers = max(workers, 1)
+    self.fetcher = (fetcher or Fetcher()).uncached()
+    self.page_size = page_size
+    self.path = path + '/' + hashlib.sha1(' '.join([self.start, self.end] + categories).encode()).hexdigest()[:16]
+
+    os.makedirs(self.path, exist_ok=True)
+
+  # Path of a page of the listing, which is only downloaded if it is not there yet
+  def page(self, listing, skip):
+
+    path = '{}/{}-{}.html'.format(self.path, listing.replace('/', '_'), skip)
+    if not os.path.exists(path):
+      content = self.fetcher.fetch('https://arxiv.org/list/{}?skip={}&show={}'.format(listing, skip, self.page_size))
+      temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+      with open(temporary_path, 'wb') as page_file:
+        page_file.write(content)
+      os.replace(temporary_path, path)
+
+    return path
+
+  @staticmethod
+  def parse(path, day):
+
+    parser = ListingParser(day)
+    with open(path, 'r', encoding='utf-8', errors='replace') as page_file:
+      for chunk in iter(lambda: page_file.read(CHUNK_SIZE), ''):
+        parser.feed(chunk)
+    parser.close()
+
+    return parser
+
+  # Generator over the papers of a listing from the days of the backfill. The total on the
+  # first page tells how many more pages there are.
+  def entries(self, listing, executor):
+
+    parser = self.parse(self.page(listing, 0), None)
+    skips = range(self.page_size, parser.total or 0, self.page_size)
+    pages = bounded_map(executor, lambda skip: self.page(listing, skip), skips, self.workers)
+
+    while parser is not None:
+      for entry in parser.entries:
+        if entry.day is None or self.start <= entry.day <= self.end:
+          yield entry
+      path = next(pages, None)
+      parser = self.parse(path, parser.day) if path is not None else None
+
+  def remove(self):
+    shutil.rmtree(self.path, ignore_errors=True)
+
+# Writes one digest with the papers of the profile's categories from `start` to `end`, like
+# after coming back from a vacation. Papers are filtered as in a regular run and a paper
+# that is in several categories or listings is written once. The digest is written to
+# '<start>-<end>' in the download directory.
+def backfill(profile, start, end, workers=1, fetcher=None, statistics=None, index=None):
+
+  statistics = statistics or run_statistics
+  pages = Backfill(start, end, profile.cat_whitelist, workers, fetcher)
+  download_path = os.path.dirname(DOWNLOAD_PATH) + '/{}-{}'.format(start, end)
+  digest_path = download_path + '/digest-{}.txt'.format(end)
+  os.makedirs(download_path, exist_ok=True)
+
+  seen_ids = set()
+  store = PaperStore(profile.store_path, profile.skip_seen)
+  with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor, \
+       DigestWriter(digest_path, profile.cat_whitelist, profile.cat_blacklist, profile.key_blacklist, index,
+                    '{} to {}'.format(start, end)) as digest:
+    for cat in profile.cat_whitelist:
+      for listing in archive_listings(cat, start, end):
+        for paper in paper_data_scraper(cat, profile.cat_blacklist, profile.key_filter, seen_ids,
+                                        listing=pages.entries(listing, executor), store=store,
+                                        statistics=statistics):
+          digest.write(paper)
+
+  store.close()
+  pages.remove()
+  print('{} papers written to {}'.format(digest.number_of_papers, digest_path))
+
+# Returns the value given after a command line flag, like the path in `--stats-json path`
+def argument_value(flag, default=None):
+
+  if flag in sys.argv[:-1] and not sys.argv[sys.argv.index(flag) + 1].startswith('--'):
+    return sys.argv[sys.argv.index(flag) + 1]
+
+  return default
+
+def config_mailer(config):
+  return Mailer(config.get('SMTP_HOST', SMTP_HOST), int(config.get('SMTP_PORT', SMTP_PORT)))
+
+def print_statistics(statistics, human_readable, json_path):
+
+  if human_readable:
+    print('\n' + statistics.report())
+
+  if json_path == '-':
+    print(json.dumps(statistics.as_dict(), indent=2))
+  elif json_path is not None:
+    with open(json_path, 'w') as json_file:
+      json.dump(statistics.as_dict(), json_file, indent=2)
+
+
 if __name__ == '__main__':
 
   # ============================== Argument Parser ==============================
@@ -538,16 +3038,98 @@ if __name__ == '__main__':
 
     print('This is {}. Get your daily arXiv dose.'.format(name))
     print("Usage: run command `python3 {}.py'.".format(name))
-    print("The python package `beatiful soup' is a requirement. Additionally, the package" +
-           "`wget' is also a requirement if downloading papers.")
+    print("The python package `beatiful soup' is a requirement.")
     print("'-h, --help': print help")
     print("'-v, --version': print version")
     print("'--config': Set up basic configuration in {}/.config/arxiv/conf".format(HOME_PATH))
+    print("'--offline': Only use pages saved in the cache in {}".format(CACHE_PATH))
+    print("'--pager': Show the papers in the pager `less'")
+    print("'--stats': Print how long each category and stage took")
+    print("'--stats-json [path]': Write the statistics as JSON to path (or the terminal)")
+    print("'--batch config...': Write the digests of several configuration files with one fetch")
+    print("'--send-queue': Send the emails waiting in {}".format(MAIL_QUEUE_PATH))
+    print("'--categories [query]': List the arXiv categories (matching query)")
+    print("'--search query': Search the papers of all earlier digests")
+    print("'--daemon [config...]': Write the digests right after every announcement of new papers")
+    print("'--refresh': Fetch the papers even if the daemon already did")
+    print("'--backfill from to': Write one digest with the papers from the dates from to to (YYYY-MM-DD)")
+    print("'--jsonl [path]': Also write the papers as JSON lines to path (or next to the digest)")
+    print("'--parquet [path]': Also write the papers as a Parquet file to path (or next to the digest)")
+    print("'--bibtex [path]': Write BibTeX entries of the downloaded papers to path (or next to the digest)")
 
     sys.exit(0)
 
+  fetcher = Fetcher(cache=HttpCache(), offline=('--offline' in sys.argv))
+
   if any([1 if arg in sys.argv else 0 for arg in ['--config']]):
-    setup()
+    setup(Color(True), fetcher=fetcher)
+    sys.exit(0)
+
+  # The fetch settings are taken from the first configuration file
+  if '--batch' in sys.argv:
+    paths = [arg for arg in sys.argv[sys.argv.index('--batch') + 1:] if not arg.startswith('--')]
+    profiles = [Profile.from_file(path) for path in paths]
+    config = config_read(path=paths[0])
+
+    try:
+      catalogue = CategoryCatalogue.load(fetcher=fetcher)
+      for profile in profiles:
+        check_categories(profile, catalogue, Color(False))
+    except (OSError, ValueError):
+      pass
+
+    batch(profiles, int(config.get('CONCURRENCY', CONCURRENCY_STD)), fetcher, config_parser(config),
+          mailer=config_mailer(config), queue=MailQueue() if config.get('MAIL_QUEUE', 'n') == 'y' else None,
+          index=SearchIndex())
+    print_statistics(run_statistics, '--stats' in sys.argv,
+                     argument_value('--stats-json', '-') if '--stats-json' in sys.argv else None)
+    sys.exit(0)
+
+  if '--categories' in sys.argv:
+    print_categories(CategoryCatalogue.load(fetcher=fetcher), argument_value('--categories', ''), Color(True))
+    sys.exit(0)
+
+  if '--search' in sys.argv:
+    query = ' '.join(arg for arg in sys.argv[sys.argv.index('--search') + 1:] if not arg.startswith('--'))
+    index = SearchIndex()
+    index.import_digests(os.path.dirname(DOWNLOAD_PATH))
+    print_search(index, query, Color(True))
+    index.close()
+    sys.exit(0)
+
+  # The fetch settings are taken from the first configuration file, or the default one
+  if '--daemon' in sys.argv:
+    paths = [arg for arg in sys.argv[sys.argv.index('--daemon') + 1:] if not arg.startswith('--')]
+    config = config_read(path=paths[0] if paths else None)
+
+    try:
+      daemon(paths, int(config.get('CONCURRENCY', CONCURRENCY_STD)), fetcher, config_parser(config),
+             mailer=config_mailer(config), queue=MailQueue() if config.get('MAIL_QUEUE', 'n') == 'y' else None)
+    except KeyboardInterrupt:
+      pass
+    sys.exit(0)
+
+  if '--backfill' in sys.argv:
+    try:
+      start, end = (date.fromisoformat(day) for day in sys.argv[sys.argv.index('--backfill') + 1:][:2])
+      if start > end:
+        raise ValueError
+    except ValueError:
+      print("Usage: `python3 {} --backfill from to' with the dates as YYYY-MM-DD, like 2024-10-01 2024-10-14."
+            .format(os.path.basename(sys.argv[0])))
+      sys.exit(1)
+    config = config_read()
+    index = SearchIndex()
+    backfill(Profile(config), start, end, int(config.get('CONCURRENCY', CONCURRENCY_STD)), fetcher, index=index)
+    index.close()
+    print_statistics(run_statistics, '--stats' in sys.argv,
+                     argument_value('--stats-json', '-') if '--stats-json' in sys.argv else None)
+    sys.exit(0)
+
+  if '--send-queue' in sys.argv:
+    queue = MailQueue()
+    sent = queue.flush(config_mailer(config_read()))
+    print('{} emails sent, {} left in the queue.'.format(sent, len(queue.messages())))
     sys.exit(0)
 
   # =============================================================================
@@ -560,40 +3142,98 @@ if __name__ == '__main__':
   except FileNotFoundError:
     color = Color(True)
     print(color.YELLOW + 'WARNING: ' + color.END + 'Configuration file not found. One will be generated from your choices below...')
-    setup(color)
+    setup(color, fetcher=fetcher)
     config = config_read()  
 
-  style = config['STYLE']
-  color = Color(config['COLORED'] == 'y')
-  cat_whitelist = [s.strip() for s in config['CATEGORY_WHITELIST'].split(';') if s != '']
-  cat_blacklist = [s.strip() for s in config['CATEGORY_BLACKLIST'].split(';') if s != '']
-  key_blacklist = [s.strip() for s in config['KEYWORD_BLACKLIST'].split(';') if s != '']
-
-  # =============================================================================
-
+  profile = Profile(config)
+  color = Color(profile.colored)
 
-  # =============================== Fetch Papers ================================
-
-  papers, total_papers = list_papers(cat_whitelist, cat_blacklist, key_blacklist)
+  try:
+    check_categories(profile, CategoryCatalogue.load(fetcher=fetcher), color)
+  except (OSError, ValueError):
+    pass
+  workers = int(config.get('CONCURRENCY', CONCURRENCY_STD))
+  parser = config_parser(config)
+  download_workers = int(config.get('DOWNLOAD_WORKERS', DOWNLOAD_WORKERS_STD))
+  streaming = (config.get('STREAMING', 'y') == 'y')
+  pager = ('--pager' in sys.argv) or (config.get('PAGER', 'n') == 'y')
+  wrap = (config.get('WRAP', 'n') == 'y')
+  mailer = config_mailer(config)
+  queue = MailQueue() if config.get('MAIL_QUEUE', 'n') == 'y' else None
+  prefetcher = (Prefetcher(PdfCache(), profile.rank_authors, fetcher)
+                if config.get('PREFETCH', 'n') == 'y' and not fetcher.offline else None)
 
   # =============================================================================
 
 
-  # =============================== Print Output ================================
+  # =============================== Fetch Papers ================================
 
   # Create the day's directory. If the directory exists don't send an email to
   # limit the number of emails to one per day
   try:
-    os.mkdir(DOWNLOAD_PATH)
+    os.mkdir(profile.download_path)
     from_address = EMAIL
   except FileExistsError:
     from_address = None
 
-  print_to_terminal(papers, color)
+  # If the daemon already collected the papers of the last announcement, its digest
+  # was written and sent, and nothing needs to be fetched. A run on another day than the
+  # daemon's digest is dated by still gets a digest of its own.
+  prefetched = None if '--refresh' in sys.argv else PrefetchCache().papers(profile)
+
+  store = PaperStore(profile.store_path, profile.skip_seen)
+  writers = exporters(profile, color)
+  if prefetched is None:
+    papers = export_papers(iter_papers(profile.cat_whitelist, profile.cat_blacklist, profile.key_filter, workers,
+                                       fetcher, parser, store), writers)
+    ranker = profile_ranker(profile, store, color)
+  else:
+    from_address = None
+  index = SearchIndex()
+
+  # =============================================================================
 
-  print_to_file(papers)
 
-  send_email(color, from_email=from_address)
+  # =============================== Print Output ================================
+
+  # In streaming mode every paper is shown and written to the digest as soon as it is
+  # scraped. Otherwise all papers are collected first, which ranking needs.
+  # The PDFs that are likely to be chosen are prefetched while the papers are shown
+  if prefetched is not None:
+    papers, statistics = prefetched
+    papers = list(export_papers(papers, writers))
+    if prefetcher is not None:
+      papers = list(prefetcher.watch(papers, PREFETCH_PAPERS if profile.rank else 0))
+    print_to_terminal(papers, color, pager, wrap, statistics)
+    if not os.path.exists(profile.digest_path):
+      print_to_file(papers, profile.cat_whitelist, profile.cat_blacklist, profile.key_blacklist, profile.digest_path,
+                    index)
+  elif streaming and ranker is None:
+    if prefetcher is not None:
+      papers = prefetcher.watch(papers)
+    with DigestWriter(profile.digest_path, profile.cat_whitelist, profile.cat_blacklist,
+                      profile.key_blacklist, index) as digest:
+      papers = stream_papers(papers, TerminalRenderer(color, pager, wrap), digest, profile.style)
+  else:
+    papers = ranker.rank(papers) if ranker is not None else list(papers)
+    if prefetcher is not None:
+      papers = list(prefetcher.watch(papers, PREFETCH_PAPERS if ranker is not None else 0))
+    print_to_terminal(papers, color, pager, wrap)
+    print_to_file(papers, profile.cat_whitelist, profile.cat_blacklist, profile.key_blacklist, profile.digest_path,
+                  index)
+
+  store.commit()
+  index.close()
+  for writer in writers:
+    writer.close()
+
+  # Queued emails are sent in the background while papers are chosen for download
+  send_email(color, from_email=from_address, to_email=profile.email, mailer=mailer, queue=queue)
+  if queue is not None:
+    mail_thread = threading.Thread(target=queue.flush, args=(mailer,))
+    mail_thread.start()
+  else:
+    mailer.close()
 
   # =============================================================================
 
@@ -602,7 +3242,26 @@ if __name__ == '__main__':
 
   download_list = download_prompt(len(papers), color)
 
-  downloader(download_list, papers, style)
+  downloaded = downloader(download_list, papers, profile.style, download_workers, fetcher, store, prefetcher)
+
+  # The download records only have the fields of the filename style, so the papers are
+  # taken from the store
+  if '--bibtex' in sys.argv:
+    bibtex = BibtexExporter(argument_value('--bibtex', os.path.splitext(profile.digest_path)[0] + '.bib'))
+    for paper in store.papers(downloaded):
+      bibtex.write(paper)
+    bibtex.close()
+  store.close()
+
+  if queue is not None:
+    mail_thread.join()
+    mailer.close()
+    if queue.messages():
+      print(color.YELLOW + 'WARNING: {} emails could not be sent and are kept in {}.'
+            .format(len(queue.messages()), queue.path) + color.END)
+
+  print_statistics(run_statistics, '--stats' in sys.argv,
+                   argument_value('--stats-json', '-') if '--stats-json' in sys.argv else None)
 
   # =============================================================================
 
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+#encoding=utf8
+
+# Synthetic arXiv listing pages for the benchmarks. The markup follows the layout of
+# https://arxiv.org/list/<category>/new and of the archive listings with day headings,
+# including replaced papers, papers without comments or abstract, HTML entities and
+# non-ASCII text. The generated pages are saved as `fixtures/generated-*.html`, pages
+# saved from arxiv.org with `capture` as `fixtures/arxiv-*.html`. The same kind of papers are
+# also available as records of the OAI-PMH interface in the arXivRaw format.
+
+import os, sys, html, random
+import importlib.util
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'arxiv-digest.py')
+
+WORDS = ('quantum field theory anyon tube algebra symmetry boundary einstein equation topological '
+         'phase lattice gauge Poincaré déjà &amp; &lt;x&gt; spin chain entanglement holography').split()
+CATEGORIES = ['hep-th', 'cond-mat.str-el', 'math.QA', 'quant-ph', 'math.AT', 'gr-qc', 'math-ph']
+
+
+def load_script():
+
+  spec = importlib.util.spec_from_file_location('arxiv_digest', SCRIPT)
+  arxiv_digest = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(arxiv_digest)
+
+  return arxiv_digest
+
+# Markup of `number_of_papers` papers of a listing, numbered from `first`. Papers are drawn
+# from a pool of ids, so pages generated with the same `id_pool` share some papers like
+# cross-listed categories do.
+def paper_entries(rng, number_of_papers, id_pool, first=1):
+
+  entries = []
+  for i in range(number_of_papers):
+
+    arxivid = '2409.{:05d}'.format(rng.randrange(id_pool))
+    replaced = ' (replaced)' if i % 7 == 6 else ''
+    title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 14))).capitalize()
+    abstract = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(80, 250)))
+    categories = rng.sample(CATEGORIES, rng.randint(1, 3))
+    subjects = ('<span class="primary-subject">Primary Subject ({})</span>'.format(categories[0]) +
+                ''.join('; Cross-listed Subject ({})'.format(category) for category in categories[1:]))
+    authors = ', \n'.join('<a href="https://arxiv.org/a/author_{0}">Author {0} M&uuml;ller</a>'.format(rng.randrange(1000))
+                          for _ in range(rng.randint(1, 6)))
+
+    comments = ''
+    if i % 3 != 0:
+      comments = ("<div class='list-comments mathjax'><span class='descriptor'>Comments:</span>\n"
+                  '      {} pages, {} figures<br/>Comments welcome!\n    </div>\n    '.format(rng.randint(5, 90), rng.randint(0, 12)))
+
+    paragraph = ''
+    if i % 11 != 5:
+      paragraph = "<p class='mathjax'>\n      {}\n      with $x^2$ &gt; 0.\n    </p>\n  ".format(abstract)
+
+    entries.append('''<dt>
+  <a name='item{0}'>[{0}]</a>
+  <a href ="/abs/{1}" title="Abstract" id="{1}">
+    arXiv:{1}
+  </a>{2}
+  [<a href="/pdf/{1}" title="Download PDF" id="pdf-{1}">pdf</a>, <a href="https://arxiv.org/html/{1}v1" title="View HTML" id="html-{1}">html</a>, <a href="/format/{1}" title="Other formats" id="oth-{1}">other</a>]
+</dt>
+<dd>
+  <div class='meta'>
+    <div class='list-title mathjax'><span class='descriptor'>Title:</span>
+      {3}
+    </div>
+    <div class='list-authors'>{4}</div>
+    {5}<div class='list-subjects'><span class='descriptor'>Subjects:</span>
+      {6}
+    </div>
+    {7}</div>
+</dd>'''.format(first + i, arxivid, replaced, title, authors, comments, subjects, paragraph))
+
+  return entries
+
+# Listing page with `number_of_papers` entries, like https://arxiv.org/list/<category>/new
+def listing_page(number_of_papers, seed=0, id_pool=None):
+
+  rng = random.Random(seed)
+  id_pool = id_pool or 4 * number_of_papers
+  html = ["<!DOCTYPE html>\n<html lang='en'>\n<head><title>New submissions</title></head>\n<body>",
+          "<div id='dlpage'>\n<h1>New submissions</h1>\n<dl id='articles'>",
+          '<h3>New submissions (showing {0} of {0} entries)</h3>'.format(number_of_papers)]
+  html += paper_entries(rng, number_of_papers, id_pool)
+  html.append('</dl>\n</div>\n</body>\n</html>\n')
+
+  return '\n'.join(html).encode('utf-8')
+
+# One page of an archive listing like https://arxiv.org/list/<category>/pastweek?skip=0&show=50.
+# The papers of each of the `days` are under a heading with the date, newest day first, and
+# the line above the papers gives the total number of entries of the whole listing.
+def archive_page(papers_per_day, days, seed=0, last_day=date(2024, 10, 18)):
+
+  rng = random.Random(seed)
+  total = papers_per_day * days
+  html = ["<!DOCTYPE html>\n<html lang='en'>\n<head><title>Recent submissions</title></head>\n<body>",
+          "<div id='dlpage'>\n<h1>Recent submissions</h1>",
+          "<div class='paging'>Total of {} entries : <span>1-{}</span>\n</div>".format(total, total),
+          "<dl id='articles'>"]
+
+  for day in range(days):
+    heading = (last_day - timedelta(days=day)).strftime('%a, %d %b %Y').replace(' 0', ' ')
+    html.append('<h3>{} (showing {} of {} entries )</h3>'.format(heading, papers_per_day, papers_per_day))
+    html += paper_entries(rng, papers_per_day, 4 * total, first=day * papers_per_day + 1)
+
+  html.append('</dl>\n</div>\n</body>\n</html>\n')
+
+  return '\n'.join(html).encode('utf-8')
+
+# Records for the OAI-PMH interface. Every paper was last changed on one of the `days` days
+# up to today, so harvests from different dates get different records.
+def oai_records(number_of_papers, seed=0, days=5):
+
+  rng = random.Random(seed)
+  today = date.today()
+  words = [html.unescape(word) for word in WORDS]
+  records = []
+
+  for i in range(number_of_papers):
+    records.append({
+      'id': '2409.{:05d}'.format(i),
+      'datestamp': (today - timedelta(days=rng.randrange(days))).isoformat(),
+      'deleted': i % 50 == 49,
+      'versions': rng.randint(2, 4) if i % 7 == 6 else 1,
+      'categories': rng.sample(CATEGORIES, rng.randint(1, 3)),
+      'title': ' '.join(rng.choice(words) for _ in range(rng.randint(5, 14))).capitalize(),
+      'authors': ['Author {} Müller'.format(rng.randrange(1000)) for _ in range(rng.randint(1, 6))],
+      'comments': '{} pages, {} figures'.format(rng.randint(5, 90), rng.randint(0, 12)) if i % 3 != 0 else None,
+      'abstract': ' '.join(rng.choice(words) for _ in range(rng.randint(80, 250)))})
+
+  return records
+
+# ListRecords answer with `records` and the resumption token of the next page, if any
+def oai_page(records, response_date, token=None):
+
+  xml = ['<?xml version="1.0" encoding="UTF-8"?>',
+         '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">',
+         '<responseDate>{}T20:00:00Z</responseDate>'.format(response_date),
+         '<request verb="ListRecords">http://localhost/oai</request>']
+
+  if not records:
+    xml.append('<error code="noRecordsMatch">No records match the request.</error>\n</OAI-PMH>\n')
+    return '\n'.join(xml).encode('utf-8')
+
+  xml.append('<ListRecords>')
+  for record in records:
+
+    header = '<header{}>\n  <identifier>oai:arXiv.org:{}</identifier>\n  <datestamp>{}</datestamp>\n</header>'.format(
+             ' status="deleted"' if record['deleted'] else '', record['id'], record['datestamp'])
+    if record['deleted']:
+      xml.append('<record>\n{}\n</record>'.format(header))
+      continue
+
+    authors = ', '.join(record['authors'][:-1]) + ' and ' + record['authors'][-1] if len(record['authors']) > 1 \
+              else record['authors'][0]
+    versions = ''.join('<version version="v{}"><date>Mon, 2 Sep 2024 18:00:00 GMT</date><size>100kb</size></version>'
+                       .format(version + 1) for version in range(record['versions']))
+    comments = '<comments>{}</comments>'.format(escape(record['comments'])) if record['comments'] else ''
+
+    xml.append('''<record>
+{0}
+<metadata>
+<arXivRaw xmlns="http://arxiv.org/OAI/arXivRaw/">
+  <id>{1}</id>
+  {2}
+  <title>{3}</title>
+  <authors>{4}</authors>
+  <categories>{5}</categories>
+  {6}
+  <abstract>  {7}
+  </abstract>
+</arXivRaw>
+</metadata>
+</record>'''.format(header, record['id'], versions, escape(record['title']), escape(authors),
+                    ' '.join(record['categories']), comments, escape(record['abstract'])))
+
+  xml.append('<resumptionToken>{}</resumptionToken>'.format(escape(token or '')))
+  xml.append('</ListRecords>\n</OAI-PMH>\n')
+
+  return '\n'.join(xml).encode('utf-8')
+
+
+# Saves the current listings of the categories from arxiv.org, one page of the new
+# submissions and the first page of the past week with its day headings. The saved pages
+# are read by the parser parity check and the benchmark next to the generated ones.
+def capture(categories):
+
+  arxiv_digest = load_script()
+  fetcher = arxiv_digest.Fetcher()
+  for category in categories:
+    for listing, url in [('new', 'https://arxiv.org/list/{}/new'),
+                         ('pastweek', 'https://arxiv.org/list/{}/pastweek?skip=0&show=100')]:
+      path = os.path.join(FIXTURES_PATH, 'arxiv-{}-{}.html'.format(category, listing))
+      with open(path, 'wb') as fixture:
+        fixture.write(fetcher.fetch(url.format(category)))
+      print('saved ' + path)
+
+
+if __name__ == '__main__':
+
+  # `python3 benchmarks/fixtures.py capture hep-th quant-ph` saves pages from arxiv.org,
+  # without arguments the generated pages are written again
+  if sys.argv[1:2] == ['capture']:
+    capture(sys.argv[2:] or ['hep-th'])
+    sys.exit()
+
+  for category, seed in [('hep-th', 1), ('quant-ph', 2)]:
+    with open(os.path.join(FIXTURES_PATH, 'generated-{}-new.html'.format(category)), 'wb') as fixture:
+      fixture.write(listing_page(60, seed=seed, id_pool=150))
+  with open(os.path.join(FIXTURES_PATH, 'generated-hep-th-pastweek.html'), 'wb') as fixture:
+    fixture.write(archive_page(12, 5, seed=3))
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+#encoding=utf8
+
+# Micro-benchmark of the keyword filter. It compares the compiled KeywordFilter with the
+# loop that checked every blacklisted keyword separately on a set of synthetic papers.
+# Run it with `python3 benchmarks/keyword_filter.py [papers] [keywords]`.
+
+import sys, random, timeit
+
+from fixtures import load_script
+
+arxiv_digest = load_script()
+
+
+def synthetic_papers(number_of_papers, vocabulary, rng):
+
+  papers = []
+  for _ in range(number_of_papers):
+    title = ' '.join(rng.choice(vocabulary) for _ in range(10)).title()
+    abstract = ' '.join(rng.choice(vocabulary) for _ in range(200))
+    papers.append((title, abstract))
+
+  return papers
+
+# The filter as it was before: lowercase both texts again for every keyword
+def loop_filter(papers, key_blacklist):
+
+  rejected = 0
+  for title, abstract in papers:
+    for keyword in key_blacklist:
+      if (keyword in title.lower()) or (keyword in abstract.lower()):
+        rejected += 1
+        break
+
+  return rejected
+
+def compiled_filter(papers, key_filter):
+
+  return sum(1 for title, abstract in papers if key_filter.check(title, abstract) is not None)
+
+
+if __name__ == '__main__':
+
+  number_of_papers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+  number_of_keywords = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+  rng = random.Random(0)
+  vocabulary = ['{}{}'.format(rng.choice(['quant', 'topolog', 'gauge', 'lattice', 'spin', 'field']), i)
+                for i in range(5000)]
+  papers = synthetic_papers(number_of_papers, vocabulary, rng)
+  key_blacklist = ['{} {}'.format(rng.choice(vocabulary), rng.choice(vocabulary))
+                   for _ in range(number_of_keywords - 10)] + rng.sample(vocabulary, 10)
+
+  key_filter = arxiv_digest.KeywordFilter(key_blacklist)
+  assert loop_filter(papers, key_blacklist) == compiled_filter(papers, key_filter)
+
+  loop_time = min(timeit.repeat(lambda: loop_filter(papers, key_blacklist), number=1, repeat=3))
+  build_time = min(timeit.repeat(lambda: arxiv_digest.KeywordFilter(key_blacklist), number=1, repeat=3))
+  compiled_time = min(timeit.repeat(lambda: compiled_filter(papers, key_filter), number=1, repeat=3))
+
+  print('{} papers, {} keywords'.format(number_of_papers, number_of_keywords))
+  print('  loop:      {:8.1f} ms'.format(1000 * loop_time))
+  print('  compiled:  {:8.1f} ms (+ {:.1f} ms to build)'.format(1000 * compiled_time, 1000 * build_time))
+  print('  speedup:   {:8.1f}x'.format(loop_time / compiled_time))
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+#encoding=utf8
+
+# Stand-in for the OAI-PMH interface of arXiv, so that PARSER = oai can be tried without
+# the network. It answers ListRecords requests with the records from fixtures.oai_records,
+# PAGE_SIZE at a time and with resumption tokens, and honours the `from` and `set`
+# arguments. With --busy the first request of every harvest is answered with 503.
+#
+#   python3 benchmarks/oai_server.py [port] [--busy]
+#
+# and set OAI_URL = http://localhost:8000/oai in the config file.
+
+import sys
+from datetime import date
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from fixtures import oai_records, oai_page
+
+PORT = 8000
+PAGE_SIZE = 100
+RECORDS = oai_records(1000, seed=1)
+
+
+def in_set(record, set_spec):
+
+  archive = set_spec.split(':')[-1]
+  return any(category.split('.')[0] == archive for category in record['categories'])
+
+class OaiHandler(BaseHTTPRequestHandler):
+
+  busy = False
+  refused = False
+
+  def do_GET(self):
+
+    url = urlsplit(self.path)
+    arguments = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+    if url.path != '/oai' or arguments.get('verb') != 'ListRecords':
+      self.send_error(404)
+      return
+
+    # The token holds the arguments of the first request and the position of the next page
+    if 'resumptionToken' in arguments:
+      set_spec, from_date, start = arguments['resumptionToken'].split('|')
+      start = int(start)
+    else:
+      set_spec, from_date, start = arguments.get('set', ''), arguments.get('from', ''), 0
+      OaiHandler.refused = self.busy and not self.refused
+      if self.refused:
+        self.send_response(503)
+        self.send_header('Retry-After', '1')
+        self.end_headers()
+        return
+
+    records = [record for record in RECORDS if record['datestamp'] >= from_date and in_set(record, set_spec)]
+    token = '{}|{}|{}'.format(set_spec, from_date, start + PAGE_SIZE) if start + PAGE_SIZE < len(records) else None
+    content = oai_page(records[start:start + PAGE_SIZE], date.today().isoformat(), token)
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/xml; charset=utf-8')
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+
+if __name__ == '__main__':
+
+  OaiHandler.busy = '--busy' in sys.argv
+  port = int(next((arg for arg in sys.argv[1:] if arg.isdigit()), PORT))
+
+  print('Serving OAI-PMH records on http://localhost:{}/oai'.format(port))
+  HTTPServer(('localhost', port), OaiHandler).serve_forever()
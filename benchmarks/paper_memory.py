@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+#encoding=utf8
+
+# Memory per paper of the Paper records compared with the dictionaries that were used
+# before, for the papers of a synthetic listing page. The strings of the fields are created
+# before measuring, so the numbers are the cost of the records themselves, and once more
+# with the strings that are not shared between papers (the url and the category lines).
+#
+#   python3 benchmarks/paper_memory.py [number of papers]
+
+import sys, tracemalloc
+
+from fixtures import load_script, listing_page
+
+arxiv_digest = load_script()
+FIELDS = ['arxivid', 'categories', 'title', 'replaced', 'abstract', 'authors', 'comments']
+
+
+def measured(function):
+
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  result = function()
+  used = tracemalloc.get_traced_memory()[0] - before
+  tracemalloc.stop()
+
+  return result, used
+
+
+if __name__ == '__main__':
+
+  number_of_papers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  entries = list(arxiv_digest.stream_listing([listing_page(number_of_papers, seed=number_of_papers)]))
+  fields = [[getattr(entry, field) for field in FIELDS] for entry in entries]
+
+  # The listing gives every paper its own copy of the category line
+  copies = lambda values: [[value if field != 'categories' else ''.join(list(value)) for field, value in zip(FIELDS, paper)]
+                           for paper in values]
+
+  _, dictionaries = measured(lambda: [dict(zip(FIELDS, paper)) for paper in fields])
+  _, records = measured(lambda: [arxiv_digest.Paper(*paper) for paper in fields])
+
+  papers = copies(fields)
+  _, dictionaries_with_strings = measured(lambda: [dict(zip(FIELDS, paper), url='https://arxiv.org/pdf/' + paper[0])
+                                                   for paper in copies(papers)])
+  _, records_with_strings = measured(lambda: [arxiv_digest.Paper(*paper) for paper in copies(papers)])
+
+  print('{} papers'.format(len(fields)))
+  print('{:30}{:>10}{:>10}'.format('bytes per paper', 'dict', 'Paper'))
+  print('{:30}{:10.0f}{:10.0f}'.format('record', dictionaries / len(fields), records / len(fields)))
+  print('{:30}{:10.0f}{:10.0f}'.format('record, url and categories', dictionaries_with_strings / len(fields),
+                                       records_with_strings / len(fields)))
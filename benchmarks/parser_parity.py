@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+#encoding=utf8
+
+# Checks that the streaming listing parser extracts exactly the same papers as the
+# BeautifulSoup parser. The pages in benchmarks/fixtures (pages captured from arxiv.org with
+# `fixtures.py capture` and generated ones) and a few more generated pages are fed to the
+# streaming parser in chunks of random size to also cover tags split between chunks. On
+# archive pages with day headings every paper must also get a day and the total must be read.
+# The check only passes if a /new and a past week listing captured from arxiv.org are among
+# the pages, and only then may STREAM_PARSER_CHECKED be set in arxiv-digest.py.
+# Run it with `python3 benchmarks/parser_parity.py`.
+
+import os, sys, glob, random
+
+from fixtures import FIXTURES_PATH, load_script, listing_page
+
+FIELDS = ['arxivid', 'replaced', 'categories', 'title', 'abstract', 'authors', 'comments']
+
+arxiv_digest = load_script()
+
+
+def random_chunks(page, rng):
+
+  chunks = []
+  start = 0
+  while start < len(page):
+    end = start + rng.randint(1, 4096)
+    chunks.append(page[start:end])
+    start = end
+
+  return chunks
+
+def compare(name, page, rng):
+
+  soup_papers = [[getattr(entry, field) for field in FIELDS] for entry in arxiv_digest.soup_listing([page])]
+  stream_papers = [[getattr(entry, field) for field in FIELDS]
+                   for entry in arxiv_digest.stream_listing(random_chunks(page, rng))]
+
+  if soup_papers != stream_papers:
+    print('{}: MISMATCH'.format(name))
+    for soup_paper, stream_paper in zip(soup_papers, stream_papers):
+      for field, soup_value, stream_value in zip(FIELDS, soup_paper, stream_paper):
+        if soup_value != stream_value:
+          print('  {} {}: {!r} != {!r}'.format(soup_paper[0], field, soup_value, stream_value))
+    return False
+
+  # The soup parser doesn't read days, so archive pages are checked on their own
+  if b'Total of ' in page:
+    parser = arxiv_digest.ListingParser()
+    parser.feed(page.decode('utf-8', errors='replace'))
+    parser.close()
+    if parser.total is None or any(entry.day is None for entry in parser.entries):
+      print('{}: days or total of the archive listing missing'.format(name))
+      return False
+    print('{}: {} papers match, {} days, total of {}'.format(name, len(soup_papers),
+                                                            len({entry.day for entry in parser.entries}), parser.total))
+    return True
+
+  print('{}: {} papers match'.format(name, len(soup_papers)))
+  return True
+
+
+if __name__ == '__main__':
+
+  rng = random.Random(0)
+  pages = []
+  captured = 0
+  for listing in ['new', 'pastweek']:
+    if glob.glob(os.path.join(FIXTURES_PATH, 'arxiv-*-{}.html'.format(listing))):
+      captured += 1
+    else:
+      print('no {} listing from arxiv.org in the fixtures, save one with `python3 benchmarks/fixtures.py capture`'
+            .format(listing))
+  for path in sorted(glob.glob(os.path.join(FIXTURES_PATH, '*.html'))):
+    with open(path, 'rb') as fixture:
+      pages.append((os.path.basename(path), fixture.read()))
+  for size in [1, 100, 1000]:
+    pages.append(('generated-{}'.format(size), listing_page(size, seed=size)))
+
+  results = [compare(name, page, rng) for name, page in pages]
+  sys.exit(0 if all(results) and captured == 2 else 1)
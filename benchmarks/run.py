@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+#encoding=utf8
+
+# Offline benchmark of the hot paths of arxiv-digest. Listing pages are served from the
+# fixtures by a stub urllib opener, so no network is needed. For every parser and page size
+# the time of each stage (fetch, parse, filter, render, write) is measured together with
+# the peak memory of the whole pipeline, and compared with a saved baseline. The startup
+# of the script is measured with `python -X importtime arxiv-digest.py -v`.
+#
+#   python3 benchmarks/run.py                   run and compare with the baseline
+#   python3 benchmarks/run.py --save-baseline   run and save the results as the baseline
+#   python3 benchmarks/run.py --sizes 100 1000  only use synthetic pages of these sizes
+
+import os, io, sys, glob, json, time, tempfile, contextlib, subprocess, tracemalloc
+import urllib.request
+import urllib.response
+from email.message import Message
+
+from fixtures import FIXTURES_PATH, SCRIPT, load_script, listing_page
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SIZES = [100, 1000, 10000]
+STAGES = ['fetch', 'parse', 'filter', 'render', 'write', 'pipeline']
+# Every stage is run REPEAT times and the fastest run counts. A stage is a regression
+# when it is TOLERANCE times slower than the baseline and by more than NOISE seconds.
+REPEAT = 3
+TOLERANCE = 1.25
+NOISE = 0.005
+# Modules that are only imported where they are used and must not be loaded by `-v`
+LAZY_MODULES = ['bs4', 'lxml', 'urllib.request', 'http.client', 'smtplib', 'email.mime.text']
+
+arxiv_digest = load_script()
+
+
+# Answers requests to arxiv.org with the fixture pages instead of going to the network
+class FixtureHandler(urllib.request.BaseHandler):
+
+  # Ask before the regular HTTPS handler
+  handler_order = 100
+
+  def __init__(self, pages):
+    self.pages = pages
+
+  def https_open(self, request):
+
+    category = request.full_url.split('/list/')[1].split('/')[0]
+    headers = Message()
+    headers['Content-Type'] = 'text/html; charset=utf-8'
+
+    response = urllib.response.addinfourl(io.BytesIO(self.pages[category]), headers, request.full_url, 200)
+    response.msg = 'OK'
+
+    return response
+
+def timed(function):
+
+  fastest = float('inf')
+  for _ in range(REPEAT):
+    start = time.perf_counter()
+    result = function()
+    fastest = min(fastest, time.perf_counter() - start)
+
+  return result, fastest
+
+def benchmark(pages, parser, key_filter, output_path):
+
+  fetcher = arxiv_digest.Fetcher(interval=0)
+  categories = list(pages)
+  statistics = arxiv_digest.Statistics()
+  timings = {}
+
+  html, timings['fetch'] = timed(lambda: [fetcher.fetch('https://arxiv.org/list/{}/new'.format(category))
+                                          for category in categories])
+
+  # Parsing includes reading all fields, since the soup parser only extracts them on access
+  def parse():
+    listings = []
+    for page in html:
+      listing = list(arxiv_digest.LISTING_PARSERS[parser]([page]))
+      for entry in listing:
+        entry.categories, entry.title, entry.abstract, entry.authors, entry.comments
+      listings.append(listing)
+    return listings
+  listings, timings['parse'] = timed(parse)
+
+  def filter_papers():
+    seen_ids = set()
+    statistics = arxiv_digest.Statistics()
+    return [paper for category, listing in zip(categories, listings)
+            for paper in arxiv_digest.paper_data_scraper(category, ['math.AT'], key_filter, seen_ids, listing=listing,
+                                                         statistics=statistics)]
+  papers, timings['filter'] = timed(filter_papers)
+
+  def render():
+    with contextlib.redirect_stdout(io.StringIO()):
+      arxiv_digest.print_to_terminal(papers, arxiv_digest.Color(True), statistics=statistics)
+  _, timings['render'] = timed(render)
+
+  _, timings['write'] = timed(lambda: arxiv_digest.print_to_file(papers, categories, ['math.AT'], [], output_path))
+
+  # The whole pipeline, and separately the peak memory it needs since tracing memory
+  # allocations slows it down
+  def pipeline():
+    statistics = arxiv_digest.Statistics()
+    with contextlib.redirect_stdout(io.StringIO()):
+      with arxiv_digest.DigestWriter(output_path, categories, ['math.AT'], []) as digest:
+        papers = arxiv_digest.iter_papers(categories, ['math.AT'], key_filter, 1, fetcher, parser, statistics=statistics)
+        renderer = arxiv_digest.TerminalRenderer(arxiv_digest.Color(True), statistics=statistics)
+        arxiv_digest.stream_papers(papers, renderer, digest, STYLE)
+  _, timings['pipeline'] = timed(pipeline)
+  tracemalloc.start()
+  pipeline()
+  timings['peak_memory'] = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  timings['papers'] = len(papers)
+
+  return timings
+
+# Time from starting the interpreter until `-v` is printed, and the time spent importing
+# modules in it according to -X importtime (the sum over the top level imports)
+def startup():
+
+  timings = {'imports': float('inf')}
+  _, timings['startup'] = timed(lambda: subprocess.run([sys.executable, SCRIPT, '-v'], capture_output=True))
+
+  for _ in range(REPEAT):
+    imports = subprocess.run([sys.executable, '-X', 'importtime', SCRIPT, '-v'], capture_output=True, text=True).stderr
+    lines = [line.split('|') for line in imports.splitlines() if line.startswith('import time:') and '|' in line]
+    modules = {name.strip() for _, _, name in lines}
+    top_level = [int(cumulative) for _, cumulative, name in lines[1:] if not name.startswith('  ')]
+    timings['imports'] = min(timings['imports'], sum(top_level) / 1e6)
+
+  timings['eager'] = [module for module in LAZY_MODULES if module in modules]
+
+  return timings
+
+def compare(results, baseline):
+
+  regressions = []
+  for name, timings in results.items():
+    for stage in STAGES + ['peak_memory', 'startup', 'imports']:
+      if stage not in timings:
+        continue
+      if name in baseline and stage in baseline[name] and baseline[name][stage] > 0:
+        ratio = timings[stage] / baseline[name][stage]
+        slower = timings[stage] - baseline[name][stage]
+        if ratio > TOLERANCE and (stage == 'peak_memory' or slower > NOISE):
+          regressions.append('{} {}: {:.2f}x the baseline'.format(name, stage, ratio))
+
+  if results['startup']['eager']:
+    regressions.append('startup imports {}'.format(', '.join(results['startup']['eager'])))
+
+  return regressions
+
+def print_results(results, baseline):
+
+  print('{:20} {:>7}'.format('benchmark', 'papers') + ''.join('{:>10}'.format(stage) for stage in STAGES)
+        + '{:>12}'.format('memory'))
+  for name, timings in results.items():
+    if name == 'startup':
+      continue
+    line = '{:20} {:7}'.format(name, timings['papers'])
+    line += ''.join('{:9.3f}s'.format(timings[stage]) for stage in STAGES)
+    line += '{:10.1f}MB'.format(timings['peak_memory'] / 1024**2)
+    print(line)
+    if name in baseline:
+      print('{:20} {:7}'.format('  baseline', '') + ''.join('{:9.3f}s'.format(baseline[name].get(stage, 0)) for stage in STAGES)
+            + '{:10.1f}MB'.format(baseline[name].get('peak_memory', 0) / 1024**2))
+
+  timings = results['startup']
+  print('\nstartup {:.3f}s, imports {:.3f}s'.format(timings['startup'], timings['imports'])
+        + (' (baseline {:.3f}s, {:.3f}s)'.format(baseline['startup']['startup'], baseline['startup']['imports'])
+           if 'startup' in baseline else ''))
+  if timings['eager']:
+    print('modules that should be imported lazily: ' + ', '.join(timings['eager']))
+
+
+STYLE = arxiv_digest.FilenameStyle(arxiv_digest.STYLE_STD)
+
+if __name__ == '__main__':
+
+  sizes = [int(size) for size in sys.argv[sys.argv.index('--sizes') + 1:] if size.isdigit()] if '--sizes' in sys.argv else SIZES
+
+  # Saved pages of /new listings, the generated ones and those captured from arxiv.org
+  suites = {}
+  for path in sorted(glob.glob(os.path.join(FIXTURES_PATH, '*-new.html'))):
+    source, category = os.path.basename(path)[:-9].split('-', 1)
+    with open(path, 'rb') as fixture:
+      suites.setdefault('arxiv' if source == 'arxiv' else 'fixtures', {})[category] = fixture.read()
+  for size in sizes:
+    suites['synthetic-{}'.format(size)] = {'bench-{}'.format(size): listing_page(size, seed=size)}
+
+  key_filter = arxiv_digest.KeywordFilter(['quantum gauge lattice', 'f(r,t)'])
+  results = {'startup': startup()}
+  with tempfile.TemporaryDirectory() as output_directory:
+    for suite, pages in suites.items():
+      urllib.request.install_opener(urllib.request.build_opener(FixtureHandler(pages)))
+      for parser in arxiv_digest.LISTING_PARSERS:
+        results['{}/{}'.format(parser, suite)] = benchmark(pages, parser, key_filter,
+                                                           os.path.join(output_directory, 'digest.txt'))
+
+  try:
+    with open(BASELINE_PATH, 'r') as baseline_file:
+      baseline = json.load(baseline_file)
+  except FileNotFoundError:
+    baseline = {}
+
+  print_results(results, baseline)
+
+  if '--save-baseline' in sys.argv:
+    with open(BASELINE_PATH, 'w') as baseline_file:
+      json.dump(results, baseline_file, indent=2)
+    print('\nThe results were saved as the baseline in {}'.format(BASELINE_PATH))
+    sys.exit(0)
+
+  regressions = compare(results, baseline)
+  if regressions:
+    print('\nRegressions:\n  ' + '\n  '.join(regressions))
+    sys.exit(1)